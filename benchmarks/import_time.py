@@ -0,0 +1,73 @@
+"""
+Cold-start import benchmark.
+
+Every target module is imported in a fresh interpreter (as a newly spawned pool worker or a
+freshly launched GUI would) and the wall time of the import is recorded. Results are printed
+as JSON so they can be compared between releases:
+
+    python benchmarks/import_time.py --repeat 5 --output import_time.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+# What each process type has to import before it can do any work
+TARGETS = {
+    "pool_worker": "ProcessingPipeline",
+    "retina_engine": "ArtificialRetinaNew",
+    "cli": "eyeball_cli",
+    "gui": "eyeball_project",
+}
+
+SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def time_import(module, repeat):
+    """
+    :param module: str, module imported in a fresh interpreter
+    :param repeat: int, number of fresh interpreters
+    :return: dict, import timings in seconds, or the error if the module cannot be imported here
+    """
+    samples = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", SNIPPET.format(module=module)],
+                                   cwd=SRC_DIR, capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {"module": module, "error": completed.stderr.strip().splitlines()[-1]}
+        samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "samples_s": samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the GUI and of a pool worker.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per target (default: 5)")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    results = {
+        "benchmark": "import_time",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {name: time_import(module, args.repeat) for name, module in TARGETS.items()},
+    }
+    report = json.dumps(results, indent=4)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Per-stage micro-benchmarks for ArtificialRetina.
+
+Every stage of ArtificialRetina.apply is timed on synthetic images (no dataset needed) for each
+resolution and parameter set, and the whole pipeline is timed end to end for each worker count.
+Results are printed as JSON so they can be stored and compared between releases:
+
+    python benchmarks/retina_stages.py --resolutions 224 512 1024 --workers 1 4 --output stages.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+import cv2
+import numpy as np
+
+from ArtificialRetinaNew import clear_retina_cache
+from eyeball_cli import load_user_input
+from ProcessingPipeline import generate_retina_object, run_pipeline
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "config.json")
+
+# Parameter sets layered over the base config, indexed like EyeballProject.colletUserInput
+VARIANTS = {
+    "base": {},
+    "clutter": {11: True},
+    "magnification": {13: True},
+    "dynamic": {8: "dynamic", 9: (10, 10)},
+    "dynamic_flow_quarter": {8: "dynamic", 9: (10, 10), 16: 0.25},
+    "all": {8: "dynamic", 9: (10, 10), 11: True, 13: True},
+}
+
+
+def synthetic_frames(count, size=640, seed=0):
+    # Smooth random frames drifting to the right, so optical flow has something to track
+    rng = np.random.default_rng(seed)
+    base = cv2.GaussianBlur(rng.integers(0, 256, (size, size + count * 4, 3), dtype=np.uint8), (15, 15), 0)
+    return [np.ascontiguousarray(base[:, i * 4:i * 4 + size]) for i in range(count)]
+
+
+def write_frames(frames, folderPath):
+    imageFiles = []
+    for i, frame in enumerate(frames):
+        fileName = f"output_{i}.png"
+        cv2.imwrite(os.path.join(folderPath, fileName), frame)
+        imageFiles.append(fileName)
+    return imageFiles
+
+
+def user_input_for(baseInput, resolution, variant):
+    userInput = list(baseInput)
+    userInput[0] = resolution
+    # keep the fovea in the same relative place at every resolution
+    userInput[1] = tuple(int(c * resolution / baseInput[0]) for c in baseInput[1])
+    userInput[2] = max(1, int(baseInput[2] * resolution / baseInput[0]))
+    for index, value in VARIANTS[variant].items():
+        userInput[index] = value
+    return userInput
+
+
+def timeit(fn, repeat, setup=None):
+    """
+    :param fn: callable, the stage to time
+    :param repeat: int, number of timed calls
+    :param setup: callable, run (untimed) before every call
+    :return: dict, timing statistics in milliseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(samples), "mean_ms": statistics.fmean(samples), "min_ms": min(samples)}
+
+
+def bench_stages(userInput, image_path, next_frame_path, repeat):
+    retina = generate_retina_object(*userInput)
+    retina.checks()
+    frame = retina.preprocess(image_path)
+    next_frame = retina.preprocess(next_frame_path)
+    retina.fovea, retina.peripheral_mask = retina.create_retina_filter()
+    retina_image = retina.apply_retina_filter(frame)
+    # static configs carry a (0, 0) grid; time the flow step with the GUI's usual grid instead
+    grid_size = retina.dynamic_foveation_grid_size if all(retina.dynamic_foveation_grid_size) else (10, 10)
+
+    stages = {
+        "preprocess": timeit(lambda: retina.preprocess(image_path), repeat),
+        "create_retina_filter": timeit(retina.create_retina_filter, repeat, setup=clear_retina_cache),
+        "create_retina_filter_cached": timeit(retina.create_retina_filter, repeat),
+        "apply_retina_filter": timeit(lambda: retina.apply_retina_filter(frame), repeat),
+        "radial_pixel_distortion": timeit(lambda: retina.radial_pixel_distortion(image=frame, distortion_intensity=retina.clutter_intensity), repeat),
+        "activation": timeit(lambda: retina.activate_cells(frame, retina_image.copy()), repeat),
+        "dynamic_fovea": timeit(lambda: retina.dynamic_fovea(prev_frame=frame, current_frame=next_frame, grid_size=grid_size), repeat),
+        "cortical_magnification": timeit(lambda: retina.cortical_magnification(image=retina_image, center=retina.fovea_center, strength=retina.magnifi_strength, radius=retina.magnifi_radius), repeat),
+        "apply": timeit(lambda: retina.apply(image_path, next_frame_path), repeat),
+    }
+    return stages
+
+
+def bench_workers(userInput, folderPath, imageFiles, workers):
+    resolution = userInput[0]
+    processedImages = np.zeros((len(imageFiles), resolution, resolution, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for _ in run_pipeline(userInput, folderPath, imageFiles, processedImages=processedImages,
+                          multiprocessingToggle=workers > 1, numCores=workers):
+        pass
+    elapsed = time.perf_counter() - start
+    return {"workers": workers, "frames": len(imageFiles), "total_s": elapsed, "frames_per_s": len(imageFiles) / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time every retina pipeline stage on synthetic images.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="base config.json (default: repository config.json)")
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[224, 512, 1024])
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts for the end-to-end run")
+    parser.add_argument("--frames", type=int, default=16, help="frames in the end-to-end run (default: 16)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per stage (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    np.random.seed(args.seed)
+    baseInput = load_user_input(args.config)
+    results = {
+        "benchmark": "retina_stages",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "stages": [],
+        "pipeline": [],
+    }
+
+    with tempfile.TemporaryDirectory() as folderPath:
+        imageFiles = write_frames(synthetic_frames(max(2, args.frames), seed=args.seed), folderPath)
+        image_path, next_frame_path = (os.path.join(folderPath, f) for f in imageFiles[:2])
+
+        for resolution in args.resolutions:
+            for variant in args.variants:
+                userInput = user_input_for(baseInput, resolution, variant)
+                stages = bench_stages(userInput, image_path, next_frame_path, args.repeat)
+                results["stages"].append({"resolution": resolution, "variant": variant, "stages": stages})
+                print(f"{resolution:>5}px {variant:<14} apply: {stages['apply']['median_ms']:.2f} ms", file=sys.stderr)
+
+            for workers in args.workers:
+                run = bench_workers(user_input_for(baseInput, resolution, "base"), folderPath, imageFiles, workers)
+                results["pipeline"].append({"resolution": resolution, **run})
+                print(f"{resolution:>5}px {workers:>2} workers: {run['frames_per_s']:.1f} frames/s", file=sys.stderr)
+
+    report = json.dumps(results, indent=4)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -164,25 +164,25 @@ class ArtificialRetina:
 
         # activate cones and rods in peripheral and fovea respectively
         # randomly select x% of pixels in the fovea and make them grayscale
-        self.fovea_selected_indices = self.__select_random_pixels(
+        self.fovea_selected_pixels = self.__select_random_pixels(
             percentage=self.fovea_active_rods, 
             mask=self.fovea)
 
         self.__apply_random_pixel_effect(
             retina_image=retina_image, original_image=preprocessed_image, 
-            selected_indices=self.fovea_selected_indices, effect='grayscale')
+            selected_pixels=self.fovea_selected_pixels, effect='grayscale')
 
         if self.verbose:
             print("[INFO] {}% rods turned active in the fovea".format(self.fovea_active_rods))
 
         # randomly select y% of pixels in the peripheral and remove grayscale effect
-        self.peripheral_selected_indices = self.__select_random_pixels(
+        self.peripheral_selected_pixels = self.__select_random_pixels(
             percentage=self.peripheral_active_cones, 
             mask=self.peripheral_mask)
 
         self.__apply_random_pixel_effect(
             retina_image=retina_image, original_image=preprocessed_image,
-            selected_indices=self.peripheral_selected_indices, effect='color')
+            selected_pixels=self.peripheral_selected_pixels, effect='color')
 
         if self.verbose:
             print("[INFO] {}% cones turned active in the peripheral".format(self.peripheral_active_cones))
@@ -375,28 +375,23 @@ class ArtificialRetina:
 
     # private function to randomly select x% of cones and rods cells   
     def __select_random_pixels(self, percentage, mask):
-        # determine the number of pixels to select based on the percentage
-        num_pixels = int(percentage / 100 * np.count_nonzero(mask)) # total pixels = HxW
+        # draw a boolean random mask that keeps each pixel with probability x%
+        random_mask = np.random.random_sample(mask.shape) < percentage / 100
 
-        # get the indices of non-zero pixels in the image mask
-        nonzero_indices = np.transpose(np.nonzero(mask))
+        # restrict the selection to the non-zero pixels of the region mask
+        selected_pixels = random_mask & (mask != 0)
 
-        # randomly select pixel coordinates
-        random_indices = np.random.choice(len(nonzero_indices), num_pixels, replace=False)
-        selected_indices = nonzero_indices[random_indices]
-
-        return selected_indices
+        return selected_pixels
 
     # private function to activate rods and cones at specified coordinates
-    def __apply_random_pixel_effect(self, retina_image, original_image, selected_indices, effect):
-        # apply the specified effect to the randomly selected pixels
-        for y, x in selected_indices:
-            if effect == 'grayscale':
-                retina_image[y, x] = np.mean(retina_image[y, x])
-            elif effect == 'color':
-                retina_image[y, x] = original_image[y, x]
-            else:
-                raise ValueError("Unsupported effect type. Supported types are 'grayscale' and 'color'.")
+    def __apply_random_pixel_effect(self, retina_image, original_image, selected_pixels, effect):
+        # apply the specified effect to all the randomly selected pixels at once
+        if effect == 'grayscale':
+            retina_image[selected_pixels] = retina_image[selected_pixels].mean(axis=-1, keepdims=True)
+        elif effect == 'color':
+            retina_image[selected_pixels] = original_image[selected_pixels]
+        else:
+            raise ValueError("Unsupported effect type. Supported types are 'grayscale' and 'color'.")
     
     def apply_retinalWarp(self, image):
         '''
@@ -424,12 +419,6 @@ class ArtificialRetina:
             #plt.title('Retina Filter with Retinal Warp Applied')
             plt.axis('off')
             plt.show()
-            
-    
-    # save the output video
-    def output_video(self,):
-        # TODO: Later
-        pass
 
 
 if __name__ == "__main__":  
@@ -1,9 +1,102 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-from skimage.transform import resize
-from tqdm import tqdm
+
+# number of retina configurations (masks and remap grids) kept in memory
+RETINA_CACHE_SIZE = 32
+
+# frames of a batch read (e.g. from a memmap) and processed together by ArtificialRetina.apply_batch
+BATCH_CHUNK_SIZE = 64
+
+# pipeline stages timed by ArtificialRetina.stage_times (seconds, accumulated until pop_stage_times)
+STAGES = ('decode', 'filter', 'clutter', 'activation', 'flow', 'magnification')
+
+
+def _read_only(*arrays) -> tuple:
+    # cached arrays are shared between frames, so guard them against in-place edits
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays
+
+
+@lru_cache(maxsize=RETINA_CACHE_SIZE)
+def _build_retina_filter(P: int, fovea_center: tuple, fovea_radius: int) -> tuple:
+    # create a 2D mask for the circular fovea region
+    mask = np.zeros((P, P), dtype=np.float32) # changed from Uint8 for smooth gradient effect
+
+    # plot the fovea on the 2D mask
+    '''
+    args:
+    mask - background on which the circle will be created
+    center - coordinates for the circle
+    radius - radius of the circle
+    (1,1,1) - value inside the circle
+    -1 - outline of the circle, -1 means no outline
+    '''
+
+    fovea = cv2.circle(mask, fovea_center, fovea_radius, (1,1,1), -1)
+
+    # create mask for the peripheral region of the retina
+    peripheral_mask = cv2.bitwise_not(fovea)
+
+    return _read_only(fovea, peripheral_mask)
+
+
+@lru_cache(maxsize=RETINA_CACHE_SIZE)
+def _build_blend_mask(P: int, fovea_center: tuple, fovea_radius: int, kernel: tuple) -> tuple:
+    fovea, _ = _build_retina_filter(P, fovea_center, fovea_radius)
+
+    # smooth the fovea edge with the gradual blur kernel; the fovea and peripheral weights
+    # are single channel float32, as cv2.blendLinear expects
+    mask = cv2.GaussianBlur(fovea, kernel, 0)
+
+    return _read_only(mask, 1 - mask)
+
+
+@lru_cache(maxsize=RETINA_CACHE_SIZE)
+def _build_magnification_maps(height: int, width: int, center: tuple, strength: float, radius: float) -> tuple:
+    # Normalize coordinates to [-1, 1] space
+    x = np.linspace(-1, 1, width)
+    y = np.linspace(-1, 1, height)
+    xv, yv = np.meshgrid(x, y)
+
+    # Normalize the focal center to [-1, 1]
+    center_x = (center[0] / width) * 2 - 1
+    center_y = (center[1] / height) * 2 - 1
+
+    # Shift grid based on the focal point
+    xv -= center_x
+    yv -= center_y
+
+    # Calculate distance from the center
+    distance = np.sqrt(xv**2 + yv**2)
+    distance = np.clip(distance, 1e-6, 1.0)
+
+    # Define outward magnification using a smooth falloff function
+    falloff = np.exp(-((distance / radius) ** 2))
+    magnification = 1 + strength * falloff
+
+    # Invert the distortion effect (scale outward)
+    xv = xv / magnification + center_x
+    yv = yv / magnification + center_y
+
+    # Map back to pixel coordinates
+    map_x = ((xv + 1) * 0.5 * width).astype(np.float32)
+    map_y = ((yv + 1) * 0.5 * height).astype(np.float32)
+
+    return _read_only(map_x, map_y)
+
+
+def clear_retina_cache() -> None:
+    # drop every cached mask and remap grid, e.g. after a large resolution sweep
+    _build_retina_filter.cache_clear()
+    _build_blend_mask.cache_clear()
+    _build_magnification_maps.cache_clear()
+
 
 class ArtificialRetina:
     '''
@@ -17,6 +110,10 @@ class ArtificialRetina:
     peripheral_gaussianBlur - enable/disable Gaussian Blur on the peripheral region,
     peripheral_gaussianBlur_kernal - Gaussian Blur kernal size,
     peripheral_grayscale - apply grayscale on the peripheral region if True,
+    flow_scale - fraction of P at which the dynamic fovea optical flow is computed (e.g. 0.5),
+                 faster but approximate, the chosen grid cell may differ from the full resolution one,
+    flow_levels - number of pyramid levels of the optical flow,
+    flow_winsize - averaging window size of the optical flow,
     verbose - emable/disable to display selected settings,
     video - True if input is a video,
     save_output - save the output image/video to drive,
@@ -41,6 +138,9 @@ class ArtificialRetina:
                  cortical_magnifi=False,
                  magnifi_strength=0.5,
                  magnifi_radius=0.3,
+                 flow_scale=1.0,
+                 flow_levels=3,
+                 flow_winsize=15,
                 #  display_output=False,
                 #  verbose=True,
                 #  save_output=False,
@@ -63,6 +163,10 @@ class ArtificialRetina:
         self.cortical_magnifi = cortical_magnifi
         self.magnifi_strength = magnifi_strength
         self.magnifi_radius = magnifi_radius
+        self.flow_scale = flow_scale
+        self.flow_levels = flow_levels
+        self.flow_winsize = flow_winsize
+        self.stage_times = dict.fromkeys(STAGES, 0.0)
         # self.display_output = display_output
         # self.verbose = verbose
         # self.save_output = save_output
@@ -71,68 +175,122 @@ class ArtificialRetina:
     def apply(self, image_path: str, next_frame_path: str) -> np.array:
         # This is the entry point for the class
 
+        # open and pre-process RGB image
+        preprocessed_image = self.preprocess(image_path)
+
+        # pre-process the next_frame (only needed for dynamic foveation)
+        next_frame_proc = self.preprocess(next_frame_path) if self.foveation_type == 'dynamic' else None
+
+        return self.apply_preprocessed(preprocessed_image, next_frame_proc)
+
+    def apply_preprocessed(self, preprocessed_image: np.array, next_frame_proc: np.array = None, prev_gray: np.array = None, next_gray: np.array = None, out: np.array = None) -> np.array:
+        # Same as apply, for frames that were already decoded by preprocess/preprocess_sequence.
+        # With out (a PxPx3 uint8 array) the result is written there instead of a new array
+
         # check if all the variables are properly assigned and valid
         self.checks()
 
 
-        # open and pre-process RGB image
-        preprocessed_image = self.preprocess(image_path)
-
+        start = time.perf_counter()
 
         # dynamically adjust the fovea location based on optic flow magnitude
         if self.foveation_type == 'dynamic':
-            # pre-process the next_frame
-            next_frame_proc = self.preprocess(next_frame_path)
-
             # pass t and t+1 frames to get coordinates for dynamic foveation
-            fovea_x, fovea_y = self.dynamic_fovea(prev_frame=preprocessed_image, current_frame=next_frame_proc, grid_size=self.dynamic_foveation_grid_size)
+            fovea_x, fovea_y = self.dynamic_fovea(prev_frame=preprocessed_image, current_frame=next_frame_proc, grid_size=self.dynamic_foveation_grid_size, prev_gray=prev_gray, current_gray=next_gray)
             
             # update self.center
             self.fovea_center = (fovea_x,fovea_y)
+            start = self.__timed('flow', start)
     
+        clutter_time = self.stage_times['clutter']
 
         # create retina_filter and generate parts of the retina
         self.fovea, self.peripheral_mask = self.create_retina_filter()
         # apply retinal filter on image
-        self.retina_image = self.apply_retina_filter(preprocessed_image)
+        # with cortical magnification the final remap writes to out, so blend into a temporary
+        self.retina_image = self.apply_retina_filter(preprocessed_image, out=None if self.cortical_magnifi else out)
+        start = self.__timed('filter', start)
+        # visual clutter is timed on its own inside apply_retina_filter
+        self.stage_times['filter'] -= self.stage_times['clutter'] - clutter_time
 
         # activate cones and rods in peripheral and fovea respectively
+        self.activate_cells(preprocessed_image, self.retina_image)
+        start = self.__timed('activation', start)
+
+        if self.cortical_magnifi == True:
+            self.retina_image = self.cortical_magnification(
+                image=self.retina_image, 
+                center=self.fovea_center, 
+                strength=self.magnifi_strength,
+                radius=self.magnifi_radius,
+                out=out
+            )
+            self.__timed('magnification', start)
+        
+        return self.retina_image
+
+    def apply_batch(self, frames: np.array, out: np.array = None, chunk_size: int = BATCH_CHUNK_SIZE) -> np.array:
+        # Apply the retina to a stack of RGB uint8 frames (N x H x W x 3 array or memmap) already in
+        # memory, e.g. from a data loader. Frames are read chunk_size at a time, resized to PxP if
+        # needed, and share the cached masks and remap grids. For dynamic foveation the stack is one
+        # sequence: frame i is paired with frame i+1, the last one with itself.
+        # Results are written into out (N x P x P x 3 uint8, e.g. a memmap), allocated if None.
+        n = len(frames)
+        if out is None:
+            out = np.empty((n, self.P, self.P, 3), dtype=np.uint8)
+        elif out.shape != (n, self.P, self.P, 3) or out.dtype != np.uint8:
+            raise ValueError(f"out must be a uint8 array of shape {(n, self.P, self.P, 3)}, got {out.dtype} {out.shape}")
+
+        for i, paired in enumerate(self.pair_frames(self.__batch_frames(frames, chunk_size))):
+            retina_image = self.apply_preprocessed(*paired, out=out[i])
+            # OpenCV falls back to a new array when it cannot write into out (e.g. a strided view)
+            if not np.shares_memory(retina_image, out[i]):
+                out[i] = retina_image
+        return out
+
+    def preprocess_array(self, image: np.array) -> np.array:
+        # pre-process an RGB frame that is already in memory (no color conversion)
+        start = time.perf_counter()
+        if image.shape[:2] != (self.P, self.P):
+            image = cv2.resize(image, (self.P, self.P))
+        preprocessed_image = np.ascontiguousarray(image, dtype=np.uint8)
+        self.__timed('decode', start)
+        return preprocessed_image
+
+    # private generator reading a batch in chunks (one sequential read per chunk of a memmap)
+    def __batch_frames(self, frames, chunk_size):
+        for start in range(0, len(frames), max(1, chunk_size)):
+            for image in np.asarray(frames[start:start + chunk_size]):
+                yield self.preprocess_array(image)
+    
+    def activate_cells(self, preprocessed_image: np.array, retina_image: np.array) -> None:
+        # activate cones and rods in peripheral and fovea respectively (in place on retina_image)
         # randomly select x% of pixels in the fovea and make them grayscale
-        self.fovea_selected_indices = self.__select_random_pixels(
+        self.fovea_selected_pixels = self.__select_random_pixels(
             percentage=self.fovea_active_rods, 
             mask=self.fovea
         )
 
         self.__apply_random_pixel_effect(
             preprocessed_image=preprocessed_image,
-            retina_image=self.retina_image, 
-            selected_indices=self.fovea_selected_indices, 
+            retina_image=retina_image, 
+            selected_pixels=self.fovea_selected_pixels, 
             effect='grayscale'
         )
 
         # randomly select y% of pixels in the peripheral and remove grayscale effect
-        self.peripheral_selected_indices = self.__select_random_pixels(
+        self.peripheral_selected_pixels = self.__select_random_pixels(
             percentage=self.peripheral_active_cones, 
             mask=self.peripheral_mask
         )
 
         self.__apply_random_pixel_effect(
             preprocessed_image=preprocessed_image,
-            retina_image=self.retina_image,
-            selected_indices=self.peripheral_selected_indices,
+            retina_image=retina_image,
+            selected_pixels=self.peripheral_selected_pixels,
             effect='color'
         )
 
-        if self.cortical_magnifi == True:
-            self.retina_image = self.cortical_magnification(
-                image=self.retina_image, 
-                center=self.fovea_center, 
-                strength=self.magnifi_strength,
-                radius=self.magnifi_radius
-            )
-        
-        return self.retina_image.astype('uint16')
-    
     def checks(self) -> None:
         # check if all the variables are properly assigned  and valid
 
@@ -143,50 +301,121 @@ class ArtificialRetina:
 
     def preprocess(self, image_path: str = None) -> np.array:
         # pre-process the raw RGB image before mapping on the retina filter
-
-        if os.path.exists(image_path):
-            image = cv2.imread(image_path)
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            # Resize the image to match the filter size (PxP)
-            preprocessed_image = cv2.resize(image_rgb, (self.P, self.P))
-            return preprocessed_image
-        else:
+        start = time.perf_counter()
+        preprocessed_image = self.decode(image_path)
+        if preprocessed_image is not None:
+            self.__timed('decode', start)
+        return preprocessed_image
+
+    def decode(self, image_path: str = None) -> np.array:
+        # read and pre-process an image file, None if it is missing or cannot be decoded.
+        # Untimed and free of shared state, so it can run on prefetch threads
+        if not os.path.exists(image_path):
+            return None
+        image = cv2.imread(image_path)
+        if image is None:
+            # file exists but could not be decoded
             return None
+        return self.preprocess_frame(image)
+
+    def preprocess_frame(self, image: np.array) -> np.array:
+        # pre-process an already decoded BGR frame (e.g. read from a video)
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # Resize the image to match the filter size (PxP)
+        return cv2.resize(image_rgb, (self.P, self.P))
+
+    def preprocess_sequence(self, image_paths: list, next_frame_path: str = None, prefetch: int = 0):
+        # decode every frame of a sequence exactly once and yield
+        # (frame, next_frame, frame_gray, next_gray) tuples ready for apply_preprocessed.
+        # The last frame is paired with next_frame_path, or with itself when there is no frame after it.
+        # With prefetch > 0 up to that many upcoming frames are decoded on threads while the
+        # current one is processed.
+        tail = [next_frame_path] if next_frame_path is not None and self.foveation_type == 'dynamic' else []
+        paths = [*image_paths, *tail]
+        if prefetch > 0:
+            frames = self.prefetch_frames(paths, prefetch)
+        else:
+            frames = (self.preprocess(image_path) for image_path in paths)
+        yield from self.pair_frames(frames, pair_last=not tail)
+
+    def preprocess_stored(self, images: list, next_image: np.array = None):
+        # same as preprocess_sequence for frames that were already pre-processed, e.g. rows of a
+        # FrameStore memmap; they are used in place, without a copy
+        tail = [next_image] if next_image is not None and self.foveation_type == 'dynamic' else []
+        frames = (self.preprocess_array(image) for image in [*images, *tail])
+        yield from self.pair_frames(frames, pair_last=not tail)
+
+    def prefetch_frames(self, image_paths: list, depth: int):
+        # decode image_paths on a small thread pool (OpenCV releases the GIL while decoding and
+        # resizing) keeping at most depth frames in flight, and yield them in order.
+        # Only the time spent waiting for a frame counts as 'decode', the rest overlaps with compute.
+        with ThreadPoolExecutor(max_workers=min(depth, os.cpu_count() or 1)) as pool:
+            pending = deque()
+            for image_path in image_paths:
+                pending.append(pool.submit(self.decode, image_path))
+                if len(pending) > depth:
+                    yield self.__wait_frame(pending.popleft())
+            while pending:
+                yield self.__wait_frame(pending.popleft())
+
+    def __wait_frame(self, future):
+        start = time.perf_counter()
+        frame = future.result()
+        self.__timed('decode', start)
+        return frame
+
+    def preprocess_stream(self, images):
+        # same as preprocess_sequence for decoded BGR frames, e.g. a VideoReader
+        def frames():
+            for image in images:
+                start = time.perf_counter()
+                frame = self.preprocess_frame(image)
+                self.__timed('decode', start)
+                yield frame
+        yield from self.pair_frames(frames())
+
+    def pair_frames(self, frames, pair_last: bool = True):
+        # For dynamic foveation a sliding window keeps the last two frames (and their grayscale
+        # versions for dynamic_fovea). With pair_last=False the last frame only serves as successor.
+
+        if self.foveation_type != 'dynamic':
+            for frame in frames:
+                yield frame, None, None, None
+            return
+
+        window = deque(maxlen=2)
+        for frame in frames:
+            window.append((frame, self.to_gray(frame)))
+            if len(window) == 2:
+                (frame_t, gray_t), (frame_t1, gray_t1) = window
+                yield frame_t, frame_t1, gray_t, gray_t1
+
+        if pair_last and window:
+            frame_t, gray_t = window[-1]
+            yield frame_t, frame_t, gray_t, gray_t
+
+    def to_gray(self, frame: np.array) -> np.array:
+        # grayscale version of a pre-processed frame, as used by the optical flow step
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame is not None else None
         
 
     def create_retina_filter(self) -> tuple:
-        # create a 2D mask for the circular fovea region
-        mask = np.zeros((self.P, self.P), dtype=np.float32) # changed from Uint8 for smooth gradient effect
-
-        # plot the fovea on the 2D mask
-        '''
-        args:
-        mask - background on which the circle will be created
-        center - coordinates for the circle
-        radius - radius of the circle
-        (1,1,1) - value inside the circle
-        -1 - outline of the circle, -1 means no outline
-        '''         
-        
-        fovea = cv2.circle(mask, self.fovea_center, self.fovea_radius, (1,1,1), -1)
-
-        # create mask for the peripheral region of the retina
-        peripheral_mask = cv2.bitwise_not(fovea)
-
-        return fovea, peripheral_mask
+        # masks are built once per (P, center, radius) and reused across frames
+        return _build_retina_filter(self.P, self.__cache_key(self.fovea_center), int(self.fovea_radius))
     
 
-    def apply_retina_filter(self, preprocessed_image: np.array) -> np.array:
+    def apply_retina_filter(self, preprocessed_image: np.array, out: np.array = None) -> np.array:
+        # uint8 in, uint8 out: every peripheral step below keeps the image in uint8.
+        # The result is blended into out when given, else over the peripheral image
  
-        # Initialize `img` with the original image
-        img = preprocessed_image.copy() # ? Why did you use image.copy() here and np.copy(image) in the radial_pixel_distortion function?
+        # Initialize `img` with the original image (copied before blending if nothing replaced it)
+        img = preprocessed_image
         
         # define kernel
         ker = self.grad_blur if self.peripheral_gaussianBlur else (1, 1)
 
-        # Initialize the mask with the original fovea
-        mask = cv2.GaussianBlur(self.fovea, ker, 0)
-        mask = np.dstack([mask] * 3)
+        # Initialize the blend weights with the original fovea (blurred once per configuration)
+        mask, peripheral_weights = _build_blend_mask(self.P, self.__cache_key(self.fovea_center), int(self.fovea_radius), self.__cache_key(ker))
 
 
         # Apply Gaussian blur to the entire image if enabled
@@ -195,141 +424,141 @@ class ArtificialRetina:
 
         # apply visual clutter to the entire image
         if self.visual_clutter == True:
+            start = time.perf_counter()
             img = self.radial_pixel_distortion(image=img, distortion_intensity=self.clutter_intensity)
+            self.__timed('clutter', start)
         
         # Convert the entire image to grayscale if enabled
         if self.peripheral_grayscale:
             img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
             img = cv2.merge([img] * 3)  # Convert to 3-channel grayscale
         
-        # Combine the foveal and peripheral regions
-        combined_image = preprocessed_image * mask + img * (1 - mask)
+        if out is None:
+            out = preprocessed_image.copy() if img is preprocessed_image else img
+
+        # Combine the foveal and peripheral regions, written in place
+        # (preprocessed_image * mask + img * (1 - mask) without float temporaries, rounded to uint8)
+        combined_image = cv2.blendLinear(preprocessed_image, img, mask, peripheral_weights, dst=out)
 
         return combined_image
 
 
     # Function to calculate optical flow and dynamically determine new fovea position
-    def dynamic_fovea(self, prev_frame=None, current_frame=None, grid_size=(10, 10)) -> tuple:
-        # Convert frames to grayscale
-        prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-        current_gray = cv2.cvtColor(current_frame, cv2.COLOR_BGR2GRAY)
+    def dynamic_fovea(self, prev_frame=None, current_frame=None, grid_size=(10, 10), prev_gray=None, current_gray=None) -> tuple:
+        # Convert frames to grayscale (unless the frame pipeline already did)
+        prev_gray = self.to_gray(prev_frame) if prev_gray is None else prev_gray
+        current_gray = self.to_gray(current_frame) if current_gray is None else current_gray
+        h, w = prev_gray.shape[:2]
+        grid_h, grid_w = grid_size
+
+        # Optionally estimate the flow on a downscaled copy (faster, but approximate: the busiest cells
+        # are often within a few percent of each other, so the coarse flow may pick a neighbouring one).
+        # The copy keeps at least one pixel per grid cell, so every cell has an average.
+        if self.flow_scale < 1:
+            flow_size = (min(w, max(grid_w, 1, round(w * self.flow_scale))), min(h, max(grid_h, 1, round(h * self.flow_scale))))
+            prev_gray = cv2.resize(prev_gray, flow_size, interpolation=cv2.INTER_AREA)
+            current_gray = cv2.resize(current_gray, flow_size, interpolation=cv2.INTER_AREA)
+
         # Calculate optical flow (only accepts single channel images) at timestamps t and t+1
-        flow = cv2.calcOpticalFlowFarneback(prev_gray, current_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        flow = cv2.calcOpticalFlowFarneback(prev_gray, current_gray, None, 0.5, self.flow_levels, self.flow_winsize, 3, 5, 1.2, 0)
         
         
-        # Calculate magnitude and angle of 2D vectors (flow vector in this case)
-        mag, ang = cv2.cartToPolar(flow[..., 0], flow[..., 1])
-        # Initialize grid for average magnitude calculation
-        h, w = mag.shape
-        grid_h, grid_w = grid_size
-        avg_magnitude = np.zeros((grid_h, grid_w))
-       
-        # Calculate average magnitude for each grid cell
-        for i in range(grid_h):
-            for j in range(grid_w):
-                y0, y1 = i * h // grid_h, (i + 1) * h // grid_h
-                x0, x1 = j * w // grid_w, (j + 1) * w // grid_w
-    
-                # after knowing what pixels are in each cell, we take the average of those pixels
-                avg_magnitude[i, j] = np.mean(mag[y0:y1, x0:x1])
-    
-        max_idx = np.unravel_index(np.argmax(avg_magnitude), avg_magnitude.shape)
+        # Calculate magnitude of 2D vectors (flow vector in this case)
+        mag = cv2.magnitude(flow[..., 0], flow[..., 1])
+        flow_h, flow_w = mag.shape
+
+        # Cell boundaries, cell i spans rows i*h//grid_h up to (i+1)*h//grid_h (of the flow image)
+        rows = np.arange(grid_h + 1) * flow_h // grid_h
+        cols = np.arange(grid_w + 1) * flow_w // grid_w
+        # Sum of every cell from the integral image at the cell corners, then the average per cell
+        corners = cv2.integral(mag, sdepth=cv2.CV_64F)[rows[:, None], cols]
+        cell_sum = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # cells without pixels (grid finer than the image) average to nan, like np.mean of an empty slice
+            avg_magnitude = cell_sum / np.outer(np.diff(rows), np.diff(cols))
+
+        # the fovea is placed in the chosen cell at full resolution; empty cells (nan) are never chosen
+        max_idx = np.unravel_index(np.nanargmax(avg_magnitude), avg_magnitude.shape)
         fovea_y, fovea_x = max_idx[0] * h // grid_h + h // (2 * grid_h), max_idx[1] * w // grid_w + w // (2 * grid_w)
         
         return fovea_x, fovea_y
 
 
     def radial_pixel_distortion(self, image, max_distortion=10, distortion_intensity=1.0) -> np.array:
-        rows, cols, _ = image.shape
-        distorted_image = np.copy(image)
-    
+        rows, cols = image.shape[:2]
+
         adjusted_max_distortion = max_distortion * distortion_intensity
-    
-        for y in range(rows):
-            for x in range(cols):
-                # Generate a random radius and angle for radial distortion
-                radius = np.random.uniform(0, adjusted_max_distortion)
-                angle = np.random.uniform(0, 2 * np.pi)
-    
-                # Convert polar to Cartesian
-                dx = int(radius * np.cos(angle))
-                dy = int(radius * np.sin(angle))
-    
-                # Calculate new pixel location
-                x_new = np.clip(x + dx, 0, cols - 1)
-                y_new = np.clip(y + dy, 0, rows - 1)
-    
-                # Set the new pixel value
-                distorted_image[y, x] = image[y_new, x_new]
-    
+
+        # Generate a random radius and angle for every pixel in one batch (float32 from here on)
+        radius = np.random.uniform(0, adjusted_max_distortion, size=(rows, cols)).astype(np.float32)
+        angle = np.random.uniform(0, 2 * np.pi, size=(rows, cols)).astype(np.float32)
+
+        # Convert polar to Cartesian, truncated towards zero like int(), in place
+        map_x = np.cos(angle)
+        map_x *= radius
+        np.trunc(map_x, out=map_x)
+        map_y = np.sin(angle, out=angle)
+        map_y *= radius
+        np.trunc(map_y, out=map_y)
+
+        # New pixel location of every pixel
+        map_x += np.arange(cols, dtype=np.float32)
+        map_y += np.arange(rows, dtype=np.float32)[:, None]
+
+        # Gather the displaced pixels, locations outside the image are clamped to its edge
+        distorted_image = cv2.remap(image, map_x, map_y, interpolation=cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+
         return distorted_image
 
 
     # private function to randomly select x% of cones and rods cells   
     def __select_random_pixels(self, percentage, mask) -> np.array:
-        # determine the number of pixels to select based on the percentage
-        num_pixels = int(percentage / 100 * np.count_nonzero(mask)) # total pixels = HxW
+        # draw a boolean random mask that keeps each pixel with probability x%
+        random_mask = np.random.random_sample(mask.shape) < percentage / 100
 
-        # get the indices of non-zero pixels in the image mask
-        nonzero_indices = np.transpose(np.nonzero(mask))
+        # restrict the selection to the non-zero pixels of the region mask
+        selected_pixels = random_mask & (mask != 0)
 
-        # randomly select pixel coordinates
-        random_indices = np.random.choice(len(nonzero_indices), num_pixels, replace=False)
-        selected_indices = nonzero_indices[random_indices]
-
-        return selected_indices
+        return selected_pixels
     
     # private function to activate rods and cones at specified coordinates
-    def __apply_random_pixel_effect(self, preprocessed_image: np.array, retina_image: np.array, selected_indices: np.array, effect: str) -> None:
-        # apply the specified effect to the randomly selected pixels
-        for y, x in selected_indices:
-            if effect == 'grayscale':
-                retina_image[y, x] = np.mean(retina_image[y, x])
-            elif effect == 'color':
-                retina_image[y, x] = preprocessed_image[y, x]
-            else:
-                raise ValueError("Unsupported effect type. Supported types are 'grayscale' and 'color'.")
+    def __apply_random_pixel_effect(self, preprocessed_image: np.array, retina_image: np.array, selected_pixels: np.array, effect: str) -> None:
+        # apply the specified effect to all the randomly selected pixels at once
+        if effect == 'grayscale':
+            retina_image[selected_pixels] = retina_image[selected_pixels].mean(axis=-1, keepdims=True)
+        elif effect == 'color':
+            retina_image[selected_pixels] = preprocessed_image[selected_pixels]
+        else:
+            raise ValueError("Unsupported effect type. Supported types are 'grayscale' and 'color'.")
         
     
-    def cortical_magnification(self, image, center, strength=0.5, radius=0.3):
+    def cortical_magnification(self, image, center, strength=0.5, radius=0.3, out=None):
         
         height, width = image.shape[:2]
-        min_dim = min(height, width) # ? Not used
-        
-        # Normalize coordinates to [-1, 1] space
-        x = np.linspace(-1, 1, width)
-        y = np.linspace(-1, 1, height)
-        xv, yv = np.meshgrid(x, y)
-        
-        # Normalize the focal center to [-1, 1]
-        center_x = (center[0] / width) * 2 - 1
-        center_y = (center[1] / height) * 2 - 1
-        
-        # Shift grid based on the focal point
-        xv -= center_x
-        yv -= center_y
-        
-        # Calculate distance from the center
-        distance = np.sqrt(xv**2 + yv**2)
-        distance = np.clip(distance, 1e-6, 1.0)
         
-        # Define outward magnification using a smooth falloff function
-        falloff = np.exp(-((distance / radius) ** 2))
-        magnification = 1 + strength * falloff
-        
-        # Invert the distortion effect (scale outward)
-        xv = xv / magnification + center_x
-        yv = yv / magnification + center_y
-        
-        # Map back to pixel coordinates
-        map_x = ((xv + 1) * 0.5 * width).astype(np.float32)
-        map_y = ((yv + 1) * 0.5 * height).astype(np.float32)
+        # Remap grids are built once per (size, center, strength, radius)
+        map_x, map_y = _build_magnification_maps(height, width, self.__cache_key(center), float(strength), float(radius))
         
         # Remap image using the distortion map
-        magnified_image = cv2.remap(image, map_x, map_y, interpolation=cv2.INTER_LINEAR)
+        magnified_image = cv2.remap(image, map_x, map_y, interpolation=cv2.INTER_LINEAR, dst=out)
         
         return magnified_image
 
+    def pop_stage_times(self) -> dict:
+        # seconds spent per stage since the last call, then start counting from zero again
+        stage_times, self.stage_times = self.stage_times, dict.fromkeys(STAGES, 0.0)
+        return stage_times
+
+    # private function to add the time elapsed since start to a stage and restart the clock
+    def __timed(self, stage, start) -> float:
+        now = time.perf_counter()
+        self.stage_times[stage] += now - start
+        return now
+
+    # private function to turn coordinates/kernel sizes into hashable cache keys
+    def __cache_key(self, values) -> tuple:
+        return tuple(int(v) for v in values)
+
 
 # # DRIVER CODE - 
 # P = 256 # output image resolution
@@ -361,6 +590,7 @@ class ArtificialRetina:
 # )
 # proc_image = retina.apply(image_path='D:\Work\Justin Wood - IUB\Lalit Pandey\EyeBall\Dataset\Large Dataset\output_0.png', next_frame_path='D:\Work\Justin Wood - IUB\Lalit Pandey\EyeBall\Dataset\Large Dataset\output_100.png')
 #  # Display the image using matplotlib
+# import matplotlib.pyplot as plt
 # plt.imshow(proc_image.astype(np.uint8))
 # #plt.title('Retina Filter Applied')
 # plt.axis('off')
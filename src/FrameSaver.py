@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# Output formats offered for saving, None keeps the extension of the input file
+SAVE_FORMATS = {"Input format": None, "PNG": ".png", "JPEG": ".jpg", "WebP (lossless)": ".webp"}
+
+# Default compression per format: PNG level (0-9), JPEG quality (0-100); WebP is always lossless
+DEFAULT_LEVELS = {".png": 3, ".jpg": 95, ".jpeg": 95}
+
+# Encoder threads, OpenCV releases the GIL while encoding so they run in parallel
+SAVE_THREADS = min(8, os.cpu_count() or 1)
+
+
+def encode_params(extension, level=None):
+    """
+    :param extension: str, file extension such as '.png'
+    :param level: int, PNG compression level or JPEG quality; the format default if None
+    :return: list, cv2.imwrite parameters
+    """
+    extension = extension.lower()
+    if level is None:
+        level = DEFAULT_LEVELS.get(extension)
+    if extension == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(np.clip(level, 0, 9))]
+    if extension in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(np.clip(level, 0, 100))]
+    if extension == ".webp":
+        # a quality above 100 selects lossless WebP
+        return [cv2.IMWRITE_WEBP_QUALITY, 101]
+    return []
+
+
+def write_frame(path, processed_image, params=None):
+    # Save a processed RGB frame with OpenCV (which expects BGR, 8-bit)
+    if not cv2.imwrite(path, cv2.cvtColor(processed_image.astype(np.uint8, copy=False), cv2.COLOR_RGB2BGR), params or []):
+        raise IOError(f"Could not write {path}")
+
+
+class FrameSaver:
+    def __init__(self, saveDir, imageFiles, extension=None, level=None, numThreads=SAVE_THREADS):
+        """
+        Encode and write processed frames on a thread pool. Frames can be submitted as soon as they
+        are processed (streaming) or all at once with save_all.
+
+        :param saveDir: str, directory the frames are written to
+        :param imageFiles: list, input file names, frame n is saved under imageFiles[n]
+        :param extension: str, output format such as '.png' (see SAVE_FORMATS); None keeps the input extension
+        :param level: int, PNG compression level or JPEG quality; the format default if None
+        :param numThreads: int, number of encoder threads
+        """
+        self.saveDir = saveDir
+        self.imageFiles = imageFiles
+        self.extension = extension
+        self.level = level
+        self.numThreads = max(1, numThreads)
+        self.pool = ThreadPoolExecutor(max_workers=self.numThreads)
+        # frames submitted but not written yet, bounded so finished frames never pile up in memory
+        self.inFlight = deque()
+        self.maxInFlight = self.numThreads * 2
+        self.lock = threading.Lock()
+        self.done = 0
+        self.errors = []
+
+    def output_path(self, n):
+        """
+        :param n: int, index into imageFiles
+        :return: str, path frame n is written to
+        """
+        fileName = self.imageFiles[n]
+        if self.extension is not None:
+            fileName = os.path.splitext(fileName)[0] + self.extension
+        return os.path.join(self.saveDir, fileName)
+
+    def submit(self, n, processed_image):
+        """
+        Queue frame n for writing; blocks while too many frames are waiting to be encoded.
+
+        :param n: int, index into imageFiles
+        :param processed_image: np.array, RGB frame
+        """
+        path = self.output_path(n)
+        params = encode_params(os.path.splitext(path)[1], self.level)
+        while len(self.inFlight) >= self.maxInFlight:
+            self.inFlight.popleft().result()
+        # the caller may reuse its buffer (e.g. a memmap rerun), so the encoder gets its own copy
+        self.inFlight.append(self.pool.submit(self.__write, path, np.array(processed_image), params))
+
+    def __write(self, path, processed_image, params):
+        try:
+            write_frame(path, processed_image, params)
+        except Exception as e:
+            with self.lock:
+                self.errors.append(f"{os.path.basename(path)}: {e}")
+        with self.lock:
+            self.done += 1
+
+    def save_all(self, processedImages):
+        """
+        Write every frame of processedImages and yield the number of written frames as they finish.
+
+        :param processedImages: array/memmap of shape (N, P, P, 3)
+        """
+        reported = 0
+        for n in range(len(processedImages)):
+            self.submit(n, processedImages[n])
+            if self.done > reported:
+                reported = self.done
+                yield reported
+        while self.inFlight:
+            self.inFlight.popleft().result()
+            if self.done > reported:
+                reported = self.done
+                yield reported
+
+    def close(self):
+        """
+        Wait for the remaining frames and stop the encoder threads.
+
+        :return: list, error messages of frames that could not be written
+        """
+        self.pool.shutdown(wait=True)
+        return self.errors
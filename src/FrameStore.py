@@ -0,0 +1,102 @@
+import hashlib
+import os
+import numpy as np
+from MemmapStore import default_scratch_dir
+
+
+def default_store_dir():
+    """
+    :return: str, directory of the preprocessed frame stores inside the scratch directory
+    """
+    return os.path.join(default_scratch_dir(), "eyeball_frames")
+
+
+def frame_store_key(folderPath, imageFiles, resolution):
+    """
+    Fingerprint of a folder's frames at one resolution: any added, removed, renamed, resized or
+    rewritten file gives a different key.
+
+    :param folderPath: str, input directory
+    :param imageFiles: list, image file names in processing order
+    :param resolution: int, P of the preprocessed PxP frames
+    :return: str, hex digest
+    """
+    digest = hashlib.sha1(f"{os.path.abspath(folderPath)}|{resolution}".encode())
+    for fileName in imageFiles:
+        try:
+            stat = os.stat(os.path.join(folderPath, fileName))
+            digest.update(f"|{fileName}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(f"|{fileName}|missing".encode())
+    return digest.hexdigest()
+
+
+def open_frame_store_spec(spec):
+    # Map the frames described by FrameStore.spec in another process
+    filename, dtype, shape, offset, complete = spec
+    return np.memmap(filename=filename, dtype=dtype, mode='r' if complete else 'r+', shape=shape, offset=offset)
+
+
+class FrameStore:
+    def __init__(self, folderPath, imageFiles, resolution, storeDir=None):
+        """
+        Packed store of the preprocessed (decoded, resized, RGB) PxP frames of a folder, one .npy file
+        per folder contents and resolution. The first run fills it while decoding as usual; later runs
+        map it and read the frames zero-copy instead of decoding the images again.
+
+        :param folderPath: str, input directory
+        :param imageFiles: list, image file names, frame i is imageFiles[i]
+        :param resolution: int, P of the preprocessed frames
+        :param storeDir: str, directory of the store files; default_store_dir() if None
+        """
+        self.storeDir = storeDir or default_store_dir()
+        self.shape = (len(imageFiles), resolution, resolution, 3)
+        self.path = os.path.join(self.storeDir, f"frames_{resolution}_{frame_store_key(folderPath, imageFiles, resolution)}.npy")
+        self.partialPath = None
+        self.frames = None
+        self.complete = False
+
+    def open(self):
+        """
+        Map the finished store if it exists, else create a partial one to be filled by this run.
+
+        :return: FrameStore, self
+        """
+        if os.path.exists(self.path):
+            try:
+                self.frames = np.load(self.path, mmap_mode='r')
+                self.complete = self.frames.shape == self.shape and self.frames.dtype == np.uint8
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable frame store {self.path}: {str(e)}")
+        if not self.complete:
+            os.makedirs(self.storeDir, exist_ok=True)
+            # written under a private name and renamed once every frame is in, so a cancelled or
+            # failed run never leaves a store with holes behind
+            self.partialPath = f"{self.path}.{os.getpid()}.partial"
+            self.frames = np.lib.format.open_memmap(self.partialPath, mode='w+', dtype=np.uint8, shape=self.shape)
+        return self
+
+    def spec(self):
+        """
+        :return: tuple, description of the frames for open_frame_store_spec in worker processes
+        """
+        return self.frames.filename, self.frames.dtype.str, self.frames.shape, self.frames.offset, self.complete
+
+    def finalize(self, ok):
+        """
+        Publish a partial store once all of its frames were written, or discard it.
+
+        :param ok: bool, every frame of the run was decoded and stored
+        """
+        if self.complete or self.partialPath is None:
+            return
+        self.frames.flush()
+        self.frames = None
+        try:
+            if ok:
+                os.replace(self.partialPath, self.path)
+            else:
+                os.remove(self.partialPath)
+        except OSError as e:
+            print(f"Could not finalize frame store {self.path}: {str(e)}")
+        self.partialPath = None
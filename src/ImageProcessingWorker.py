@@ -1,43 +1,8 @@
-import datetime, os, multiprocessing
-from PyQt6.QtCore import QDir, QThread, pyqtSignal
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from ArtificialRetinaNew import ArtificialRetina
-
-def process_image(resolution, fovea_center, fovea_radius, peripheral_active_cones, fovea_active_rods, peripheral_gaussianBlur, peripheral_gaussianBlur_kernal, peripheral_grayscale, \
-            fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius, folderPath, fileName, imageFiles, i):
-    try:
-        # Create the retina object within the worker process
-        retina = ArtificialRetina(
-            P=resolution,
-            fovea_center=fovea_center,
-            fovea_radius=fovea_radius,
-            peripheral_active_cones=peripheral_active_cones,
-            fovea_active_rods=fovea_active_rods,
-            peripheral_gaussianBlur=peripheral_gaussianBlur,
-            peripheral_gaussianBlur_kernal=peripheral_gaussianBlur_kernal,
-            peripheral_grayscale=peripheral_grayscale,
-            foveation_type = fovea_type,
-            dynamic_foveation_grid_size=fovea_grid_size,
-            grad_blur=grad_blur,
-            visual_clutter=visual_clutter,
-            clutter_intensity=clutter_intensity,
-            cortical_magnifi=cortical_magnification,
-            magnifi_strength=magnifi_strength,
-            magnifi_radius=magnifi_radius,
-        )
-
-        # Process the image
-        image_path = os.path.join(folderPath, fileName)
-        if fovea_type == "dynamic":
-            next_frame_path = imageFiles[i+1] if i+1 < len(imageFiles) else image_path
-            next_frame_path = os.path.join(folderPath, next_frame_path)
-            processed_image = retina.apply(image_path=image_path, next_frame_path=next_frame_path)
-        else:
-            processed_image = retina.apply(image_path=image_path, next_frame_path=None)
-        return i, processed_image
-    except Exception as e:
-        print(f"Error processing image {fileName}: {str(e)}")
-        return i, None
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from PyQt6.QtCore import QThread, pyqtSignal
 
 
 class ImageProcessingWorker(QThread):
@@ -45,9 +10,14 @@ class ImageProcessingWorker(QThread):
     estimated_time = pyqtSignal(object)
     result = pyqtSignal(object)
     processTime = pyqtSignal(object)
+    stageTimes = pyqtSignal(object)
 
-    def __init__(self, userInput, folderPath, imageFiles, multiprocessingToggle, numCores, processedImages):
+    def __init__(self, userInput, folderPath, imageFiles, multiprocessingToggle, numCores, processedImages, saver=None, outputDir=None, frameStoreDir=None, useResultCache=False):
         super().__init__()
+        self.saver = saver
+        self.frameStoreDir = frameStoreDir
+        self.useResultCache = useResultCache
+        self.outputDir = outputDir
         self.userInput = userInput
         self.folderPath = folderPath
         self.imageFiles = imageFiles
@@ -59,68 +29,184 @@ class ImageProcessingWorker(QThread):
         print("Thread exited")
 
     def run(self):
+        # Imported here so the GUI starts without loading OpenCV and the retina engine
+        from ProcessingPipeline import run_pipeline, StageProfile
+        from FrameStore import FrameStore
+        from ResultCache import ResultCache
+
         start_time = datetime.datetime.now()
         imageFiles_cnt = len(self.imageFiles)
-        if self.multiprocessingToggle:
-            with multiprocessing.Pool(processes=self.numCores) as pool:
-                results = []
-                for i, fileName in enumerate(self.imageFiles):
-                    result = pool.apply_async(process_image, (*self.userInput, self.folderPath, fileName, self.imageFiles, i))
-                    results.append(result)
-
-                for i, result in enumerate(results):
-                    try:
-                        n, processed_image = result.get()
-                        if processed_image is not None:
-                            self.processedImages[n] = processed_image
-                        self.progress.emit(i+1)
-                        
-                        # Calculate estimated time
-                        elapsed_time = datetime.datetime.now() - start_time
-                        estimated_time = elapsed_time / (i+1) * (imageFiles_cnt - (i+1))
-                        self.estimated_time.emit(f"Estimated Time Remaining: {estimated_time}")
-                    except Exception as e:
-                        print(f"Error processing future: {str(e)}")
-        else:
-            retina = self.generate_retina_object(*self.userInput)
-            for i, fileName in enumerate(self.imageFiles):
-                image_path = QDir(self.folderPath).filePath(fileName)
-                if self.userInput[9] == "dynamic":
-                    next_frame_path = self.imageFiles[i+1] if i+1 < len(self.imageFiles) else self.imageFiles[i]
-                    next_frame_path = QDir(self.folderPath).filePath(next_frame_path)
-                    self.processedImages[i] = retina.apply(image_path=image_path, next_frame_path=next_frame_path)
-                else:
-                    self.processedImages[i] = retina.apply(image_path=image_path, next_frame_path=None)
-                self.progress.emit(i+1)
-                # Calculate estimated time
-                elapsed_time = datetime.datetime.now() - start_time
-                estimated_time = elapsed_time / (i+1) * (imageFiles_cnt - (i+1))
-                self.estimated_time.emit(f"Estimated Time Remaining: {estimated_time}")
+        profile = StageProfile()
+        failures = []
+        # keyed on every input file's size and mtime, so the stat calls stay off the GUI thread
+        frameStore = FrameStore(self.folderPath, self.imageFiles, self.userInput[0], self.frameStoreDir) if self.frameStoreDir else None
+        # frames processed by an earlier run with the same settings are restored instead of recomputed
+        resultCache = ResultCache() if self.useResultCache else None
+        for done in run_pipeline(self.userInput, self.folderPath, self.imageFiles, processedImages=self.processedImages, outputDir=self.outputDir,
+                                 multiprocessingToggle=self.multiprocessingToggle, numCores=self.numCores, profile=profile,
+                                 saver=self.saver, frameStore=frameStore, resultCache=resultCache,
+                                 failures=failures):
+            self.progress.emit(done)
+            # a snapshot, the profile keeps changing while the GUI thread reads it
+            self.stageTimes.emit(profile.to_dict())
+
+            # Calculate estimated time
+            elapsed_time = datetime.datetime.now() - start_time
+            estimated_time = elapsed_time / done * (imageFiles_cnt - done)
+            self.estimated_time.emit(f"Estimated Time Remaining: {estimated_time}")
         
+        if failures:
+            print(f"Could not process {len(failures)} images: {[self.imageFiles[n] for n in sorted(failures)[:5]]}")
+
+        if self.saver is not None:
+            # frames streamed to disk during the run, wait for the last ones to be written
+            errors = self.saver.close()
+            if errors:
+                print(f"Could not save {len(errors)} images: {errors[:5]}")
+
         end_time = datetime.datetime.now()
         print(f"Time taken: {end_time - start_time}")
         self.estimated_time.emit(f"Time taken: {end_time - start_time}")
         self.processTime.emit(f"{end_time - start_time}")
         self.result.emit(self.processedImages)
-    
-    # Generate the retina object
-    def generate_retina_object(self, resolution, fovea_center, fovea_radius, peripheral_active_cones, fovea_active_rods, peripheral_gaussianBlur, peripheral_gaussianBlur_kernal, peripheral_grayscale, \
-            fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius):
-        retina = ArtificialRetina(P=resolution,
-                                    foveation_type = fovea_type,
-                                    dynamic_foveation_grid_size=fovea_grid_size,
-                                    fovea_center=fovea_center,
-                                    fovea_radius=fovea_radius,
-                                    peripheral_active_cones=peripheral_active_cones,
-                                    fovea_active_rods=fovea_active_rods,
-                                    peripheral_gaussianBlur=peripheral_gaussianBlur,
-                                    peripheral_gaussianBlur_kernal=peripheral_gaussianBlur_kernal,
-                                    peripheral_grayscale=peripheral_grayscale,
-                                    grad_blur=grad_blur,
-                                    visual_clutter=visual_clutter,
-                                    clutter_intensity=clutter_intensity,
-                                    cortical_magnifi=cortical_magnification,
-                                    magnifi_strength=magnifi_strength,
-                                    magnifi_radius=magnifi_radius,
-                                    )
-        return retina
\ No newline at end of file
+
+
+class VideoProcessingWorker(QThread):
+    progress = pyqtSignal(int)
+    estimated_time = pyqtSignal(object)
+    result = pyqtSignal(object)
+    processTime = pyqtSignal(object)
+    stageTimes = pyqtSignal(object)
+    error = pyqtSignal(object)
+
+    def __init__(self, userInput, videoPath, outputPath, frameCount=0):
+        super().__init__()
+        self.userInput = userInput
+        self.videoPath = videoPath
+        self.outputPath = outputPath
+        self.frameCount = frameCount
+
+    def run(self):
+        # Imported here so the GUI starts without loading OpenCV and the retina engine
+        from ProcessingPipeline import run_video_pipeline, StageProfile
+
+        start_time = datetime.datetime.now()
+        profile = StageProfile()
+        try:
+            for done in run_video_pipeline(self.userInput, self.videoPath, self.outputPath, profile=profile):
+                self.progress.emit(done)
+                self.stageTimes.emit(profile.to_dict())
+
+                elapsed_time = datetime.datetime.now() - start_time
+                if self.frameCount > done:
+                    estimated_time = elapsed_time / done * (self.frameCount - done)
+                    self.estimated_time.emit(f"Estimated Time Remaining: {estimated_time}")
+                else:
+                    self.estimated_time.emit(f"Frames processed: {done}")
+        except Exception as e:
+            self.error.emit(str(e))
+            return
+
+        end_time = datetime.datetime.now()
+        print(f"Time taken: {end_time - start_time}")
+        self.estimated_time.emit(f"Time taken: {end_time - start_time}")
+        self.processTime.emit(f"{end_time - start_time}")
+        self.result.emit(self.outputPath)
+
+
+class ImageSavingWorker(QThread):
+    progress = pyqtSignal(int)
+    result = pyqtSignal(object)
+
+    def __init__(self, saver, processedImages):
+        super().__init__()
+        self.saver = saver
+        self.processedImages = processedImages
+
+    def run(self):
+        # Frames are encoded and written on the saver's thread pool, this thread only reports progress
+        for done in self.saver.save_all(self.processedImages):
+            self.progress.emit(done)
+        self.result.emit(self.saver.close())
+
+
+class PreviewWorker(QThread):
+    # generation of the request, RGB preview image, render time in seconds
+    result = pyqtSignal(int, object, float)
+    error = pyqtSignal(int, str)
+
+    def __init__(self, cachedFrames=4):
+        """
+        Long-lived thread rendering single frames at preview resolution. Requests made while a frame is
+        rendering replace each other, so only the latest one is rendered next, and a render that was
+        overtaken by a newer request is dropped instead of shown.
+
+        :param cachedFrames: int, decoded frames kept, parameter changes re-render the same frame
+        """
+        super().__init__()
+        self.condition = threading.Condition()
+        self.request = None
+        self.stopped = False
+        self.cachedFrames = cachedFrames
+        self.frames = OrderedDict()
+
+    def render(self, generation, userInput, imagePath, nextImagePath=None):
+        """
+        :param generation: int, identifies the request in the result/error signals
+        :param userInput: tuple, retina parameters at full resolution
+        :param imagePath: str, frame to render
+        :param nextImagePath: str, its successor for dynamic foveation, or None
+        """
+        with self.condition:
+            self.request = (generation, userInput, imagePath, nextImagePath)
+            self.condition.notify()
+        if not self.isRunning():
+            self.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        from ProcessingPipeline import generate_retina_object, preview_user_input
+
+        while True:
+            with self.condition:
+                while self.request is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                generation, userInput, imagePath, nextImagePath = self.request
+                self.request = None
+
+            start = time.perf_counter()
+            try:
+                retina = generate_retina_object(*preview_user_input(userInput))
+                frame = self.frame(retina, imagePath)
+                nextFrame = self.frame(retina, nextImagePath) if nextImagePath else None
+                frames = next(retina.preprocess_stored([frame], next_image=nextFrame))
+                preview = retina.apply_preprocessed(*frames).copy()
+            except Exception as e:
+                self.error.emit(generation, str(e))
+                continue
+
+            with self.condition:
+                stale = self.request is not None
+            if not stale:
+                self.result.emit(generation, preview, time.perf_counter() - start)
+
+    def frame(self, retina, imagePath):
+        # decoded at preview resolution once, the settings change far more often than the frame
+        key = (imagePath, retina.P)
+        if key in self.frames:
+            self.frames.move_to_end(key)
+            return self.frames[key]
+        frame = retina.decode(imagePath)
+        if frame is None:
+            raise IOError(f"Could not read {imagePath}")
+        self.frames[key] = frame
+        while len(self.frames) > self.cachedFrames:
+            self.frames.popitem(last=False)
+        return frame
@@ -0,0 +1,84 @@
+import atexit
+import os
+import tempfile
+import numpy as np
+
+# Scratch directory for the output memmap when none is configured, e.g. a fast NVMe disk or tmpfs
+SCRATCH_DIR_ENV = "EYEBALL_SCRATCH_DIR"
+
+
+def default_scratch_dir():
+    """
+    :return: str, $EYEBALL_SCRATCH_DIR if set, else the system temp directory
+    """
+    return os.environ.get(SCRATCH_DIR_ENV) or tempfile.gettempdir()
+
+
+class MemmapStore:
+    def __init__(self, scratchDir=None, npy=False):
+        """
+        Disk-backed output array of a run. Every store owns its own uniquely named file in scratchDir,
+        so several app instances never share a file. A raw .mmap file is deleted on release and at exit.
+
+        :param scratchDir: str, directory of the backing file; default_scratch_dir() if None
+        :param npy: bool, write a .npy file (np.lib.format.open_memmap) that downstream tools can
+                    reopen zero-copy with np.load(path, mmap_mode='r'), instead of a raw .mmap.
+                    The .npy file is kept on release and at exit, see path.
+        """
+        self.scratchDir = scratchDir or default_scratch_dir()
+        self.npy = npy
+        self.array = None
+        self.path = None
+        # the current file is a .npy output to be kept for other tools
+        self.keep = False
+        atexit.register(self.release)
+
+    def open(self, shape, dtype='uint8'):
+        """
+        Return an array of the given shape, reusing the current file when shape, dtype and format match
+        (a rerun of the same dataset and resolution) and replacing it otherwise.
+
+        :param shape: tuple, (N, P, P, 3)
+        :param dtype: str, element type
+        :return: np.memmap
+        """
+        shape = tuple(shape)
+        if self.array is not None and self.array.shape == shape and self.array.dtype == np.dtype(dtype) \
+                and self.path.endswith(".npy") == self.npy and os.path.dirname(self.path) == os.path.abspath(self.scratchDir):
+            return self.array
+
+        self.release()
+        os.makedirs(self.scratchDir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="eyeball_output_" if self.npy else "eyeball_", suffix=".npy" if self.npy else ".mmap",
+                                         dir=os.path.abspath(self.scratchDir))
+        os.close(fd)
+        self.keep = self.npy
+        if self.npy:
+            self.array = np.lib.format.open_memmap(self.path, mode='w+', dtype=dtype, shape=shape)
+        else:
+            self.array = np.memmap(filename=self.path, dtype=dtype, mode='w+', shape=shape)
+        return self.array
+
+    def release(self):
+        """Drop the array and delete its backing file, unless it is a .npy output to keep."""
+        if self.array is not None:
+            if self.keep:
+                self.array.flush()
+            # close the mapping first, Windows refuses to delete a mapped file
+            mmap = getattr(self.array, '_mmap', None)
+            self.array = None
+            try:
+                if mmap is not None:
+                    mmap.close()
+            except BufferError:
+                # still referenced elsewhere (e.g. by a preview), deleting works on POSIX anyway
+                pass
+        if self.keep and self.path is not None:
+            print(f"Output kept at {self.path}")
+        elif self.path is not None and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f"Could not remove {self.path}: {str(e)}")
+        self.path = None
+        self.keep = False
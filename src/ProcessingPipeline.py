@@ -0,0 +1,433 @@
+import os, multiprocessing, time
+import numpy as np
+from ArtificialRetinaNew import ArtificialRetina
+from SequenceLoader import SequenceLoader
+from VideoStream import VideoReader, VideoWriter, VIDEO_QUEUE_SIZE
+from FrameSaver import write_frame
+from FrameStore import open_frame_store_spec
+
+# Number of chunks handed to every worker process; more chunks give smoother progress updates
+CHUNKS_PER_WORKER = 4
+
+# Frames decoded ahead on threads while the current frame is processed, 0 decodes inline
+PREFETCH_DEPTH = 4
+
+# Prefetch depth inside pool workers: the other processes already keep the cores busy, so every worker
+# only overlaps one decode with its compute instead of adding PREFETCH_DEPTH threads per core
+WORKER_PREFETCH_DEPTH = 1
+
+# Frame size the live preview renders at, pixel sizes of the parameters are scaled to it
+PREVIEW_RESOLUTION = 256
+
+# Per-process state, built once by init_worker and reused for every frame the process handles
+_worker_state = {}
+
+
+def generate_retina_object(resolution, fovea_center, fovea_radius, peripheral_active_cones, fovea_active_rods, peripheral_gaussianBlur, peripheral_gaussianBlur_kernal, peripheral_grayscale, \
+        fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius, \
+        flow_scale=1.0, flow_levels=3, flow_winsize=15):
+    retina = ArtificialRetina(P=resolution,
+                                foveation_type = fovea_type,
+                                dynamic_foveation_grid_size=fovea_grid_size,
+                                fovea_center=fovea_center,
+                                fovea_radius=fovea_radius,
+                                peripheral_active_cones=peripheral_active_cones,
+                                fovea_active_rods=fovea_active_rods,
+                                peripheral_gaussianBlur=peripheral_gaussianBlur,
+                                peripheral_gaussianBlur_kernal=peripheral_gaussianBlur_kernal,
+                                peripheral_grayscale=peripheral_grayscale,
+                                grad_blur=grad_blur,
+                                visual_clutter=visual_clutter,
+                                clutter_intensity=clutter_intensity,
+                                cortical_magnifi=cortical_magnification,
+                                magnifi_strength=magnifi_strength,
+                                magnifi_radius=magnifi_radius,
+                                flow_scale=flow_scale,
+                                flow_levels=flow_levels,
+                                flow_winsize=flow_winsize,
+                                )
+    return retina
+
+
+def scale_kernel(kernel, scale):
+    # Blur kernel scaled with the frame, kept odd as cv2.GaussianBlur requires
+    if kernel is None:
+        return None
+    return tuple(max(1, int(round(k * scale)) // 2 * 2 + 1) for k in kernel)
+
+
+def preview_user_input(userInput, resolution=PREVIEW_RESOLUTION):
+    # The same retina parameters for a lower resolution: the fovea, the blur kernels and the optical
+    # flow window are given in pixels of the full frame and are scaled with it, the other parameters
+    # are relative already
+    scale = resolution / userInput[0]
+    if scale >= 1:
+        return tuple(userInput)
+    values = list(userInput)
+    values[0] = resolution
+    values[1] = tuple(int(round(c * scale)) for c in userInput[1])
+    values[2] = max(1, int(round(userInput[2] * scale)))
+    values[6] = scale_kernel(userInput[6], scale)
+    values[10] = scale_kernel(userInput[10], scale)
+    values[18] = max(1, int(round(userInput[18] * scale)))
+    return tuple(values)
+
+
+def init_worker(userInput, folderPath, imageFiles, nextFrames, memmapSpec=None, outputDir=None, prefetch=WORKER_PREFETCH_DEPTH, frameStoreSpec=None, resultCache=None):
+    # Runs once per pool process: the retina (and its cached masks) lives as long as the process
+    _worker_state['retina'] = generate_retina_object(*userInput)
+    _worker_state['fovea_type'] = userInput[8]
+    _worker_state['folderPath'] = folderPath
+    _worker_state['imageFiles'] = imageFiles
+    _worker_state['nextFrames'] = nextFrames
+    _worker_state['outputDir'] = outputDir
+    _worker_state['prefetch'] = prefetch
+    # Open the parent's output memmap so frames are written in place instead of pickled back
+    _worker_state['output'] = open_memmap_spec(memmapSpec) if memmapSpec is not None else None
+    # Preprocessed frames are read from (or, on the first run, written to) the shared frame store
+    _worker_state['frameStore'] = open_frame_store_spec(frameStoreSpec) if frameStoreSpec is not None else None
+    _worker_state['storeComplete'] = frameStoreSpec is not None and frameStoreSpec[4]
+    # Finished frames are added to the result cache by the worker that made them
+    _worker_state['resultCache'] = resultCache
+
+
+def memmap_spec(array):
+    # Describe a np.memmap so another process can map the same file; None for in-memory arrays
+    if isinstance(array, np.memmap) and array.filename is not None:
+        return array.filename, array.dtype.str, array.shape, array.offset
+    return None
+
+
+def open_memmap_spec(spec):
+    filename, dtype, shape, offset = spec
+    return np.memmap(filename=filename, dtype=dtype, mode='r+', shape=shape, offset=offset)
+
+
+def process_image(retina, i, fileName, frames):
+    try:
+        # Process the already decoded frame (and its successor for dynamic foveation)
+        processed_image = retina.apply_preprocessed(*frames)
+        return i, processed_image
+    except Exception as e:
+        print(f"Error processing image {fileName}: {str(e)}")
+        return i, None
+
+
+def next_index(run, nextFrames, fovea_type):
+    # For dynamic foveation, the true next frame after a run of consecutive frames
+    return nextFrames[run[-1]] if fovea_type == "dynamic" and len(run) else None
+
+
+def sequence_paths(folderPath, imageFiles, run, nextFrames, fovea_type):
+    # Paths of a run of consecutive frames plus, for dynamic foveation, the true next frame after it
+    paths = [os.path.join(folderPath, imageFiles[i]) for i in run]
+    nextIndex = next_index(run, nextFrames, fovea_type)
+    next_frame_path = os.path.join(folderPath, imageFiles[nextIndex]) if nextIndex is not None else None
+    return paths, next_frame_path
+
+
+def process_run(retina, folderPath, imageFiles, run, nextFrames, fovea_type, prefetch=0, frameStore=None, storeComplete=False):
+    # Each frame of the run is decoded once, even though dynamic foveation uses it twice.
+    # With a complete frame store nothing is decoded, the frames are read from it instead;
+    # with a partial one every decoded frame is also written to it for the next run.
+    # Never raises: frames that could not be read are yielded as failed (None), like process_image does.
+    started = 0
+    try:
+        if frameStore is not None and storeComplete:
+            nextIndex = next_index(run, nextFrames, fovea_type)
+            sequence = retina.preprocess_stored([frameStore[i] for i in run],
+                                                next_image=frameStore[nextIndex] if nextIndex is not None else None)
+        else:
+            paths, next_frame_path = sequence_paths(folderPath, imageFiles, run, nextFrames, fovea_type)
+            sequence = retina.preprocess_sequence(paths, next_frame_path=next_frame_path, prefetch=prefetch)
+        for i, frames in zip(run, sequence):
+            started += 1
+            if frameStore is not None and not storeComplete and frames[0] is not None:
+                try:
+                    frameStore[i] = frames[0]
+                except Exception as e:
+                    # failed, so the store with its missing frame is discarded instead of published
+                    print(f"Error storing image {imageFiles[i]}: {str(e)}")
+                    yield i, None
+                    continue
+            yield process_image(retina, i, imageFiles[i], frames)
+    except Exception as e:
+        print(f"Error reading image {imageFiles[run[started]] if started < len(run) else imageFiles[run[-1]]}: {str(e)}")
+        for i in run[started:]:
+            yield i, None
+
+
+def store_frame(n, processed_image, output, outputDir, imageFiles, resultCache=None):
+    # Put a finished frame where it belongs; returns (index, status, frame still to be copied by the caller)
+    if processed_image is None:
+        return n, False, None
+    if resultCache is not None:
+        resultCache.put(n, processed_image)
+    if outputDir is not None:
+        try:
+            write_frame(os.path.join(outputDir, imageFiles[n]), processed_image)
+        except Exception as e:
+            print(f"Error writing image {imageFiles[n]}: {str(e)}")
+            return n, False, None
+        return n, True, None
+    if output is not None:
+        # Written straight into the shared memmap, only the index and status go back
+        output[n] = processed_image
+        return n, True, None
+    return n, True, processed_image
+
+
+def process_chunk(chunk):
+    # Only the frame indices travel to the worker; everything else was sent once in init_worker.
+    # The stage timings of the chunk travel back with its results.
+    retina = _worker_state['retina']
+    results = []
+    write_time = 0.0
+    for run in chunk:
+        for n, processed_image in process_run(retina, _worker_state['folderPath'], _worker_state['imageFiles'],
+                                              run, _worker_state['nextFrames'], _worker_state['fovea_type'], _worker_state['prefetch'],
+                                              _worker_state['frameStore'], _worker_state['storeComplete']):
+            start = time.perf_counter()
+            results.append(store_frame(n, processed_image, _worker_state['output'], _worker_state['outputDir'], _worker_state['imageFiles'],
+                                       _worker_state['resultCache']))
+            write_time += time.perf_counter() - start
+    return results, os.getpid(), {**retina.pop_stage_times(), 'write': write_time}
+
+
+def frame_runs(imageFiles, fovea_type):
+    # Runs of frames that can be processed as one sequence, and each frame's true successor.
+    # Static foveation has no frame pairs, so the whole list is a single run.
+    loader = SequenceLoader(imageFiles, sort=False)
+    if fovea_type == "dynamic":
+        return loader.runs, loader.nextFrames
+    return [list(range(len(loader)))], loader.nextFrames
+
+
+def uncached_runs(runs, missing):
+    # Split the runs into pieces of consecutive frames that are missing from the result cache.
+    # A piece keeps its frames' true successors (nextFrames), so dynamic foveation still pairs
+    # the last frame of a piece with the cached frame after it.
+    pieces = []
+    for run in runs:
+        piece = []
+        for i in run:
+            if i in missing:
+                piece.append(i)
+            elif piece:
+                pieces.append(piece)
+                piece = []
+        if piece:
+            pieces.append(piece)
+    return pieces
+
+
+def chunk_runs(runs, numChunks):
+    # Split the runs into at most ~numChunks chunks of equal size; a chunk holds whole or partial runs,
+    # so a sequence can be spread over several workers and short sequences are packed together
+    chunkSize = max(1, -(-sum(len(run) for run in runs) // max(1, numChunks)))
+    chunks, chunk, filled = [], [], 0
+    for run in runs:
+        start = 0
+        while start < len(run):
+            take = min(chunkSize - filled, len(run) - start)
+            chunk.append(run[start:start + take])
+            filled += take
+            start += take
+            if filled == chunkSize:
+                chunks.append(chunk)
+                chunk, filled = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class StageProfile:
+    def __init__(self):
+        """
+        Time spent per pipeline stage (decode / filter / clutter / activation / flow / magnification / write)
+        over a run, in total and per worker process.
+        """
+        self.stage_times = {}
+        self.frames = 0
+        self.workers = {}
+
+    def add(self, worker, stage_times, frames):
+        """
+        :param worker: int, process id of the worker that produced the timings
+        :param stage_times: dict, seconds per stage
+        :param frames: int, number of frames the timings cover
+        """
+        workerProfile = self.workers.setdefault(worker, {'frames': 0, 'stage_times': {}})
+        for totals in (self.stage_times, workerProfile['stage_times']):
+            for stage, seconds in stage_times.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        workerProfile['frames'] += frames
+        self.frames += frames
+
+    def breakdown(self):
+        """
+        :return: dict, mean milliseconds per frame for every stage
+        """
+        if self.frames == 0:
+            return {}
+        return {stage: seconds * 1000 / self.frames for stage, seconds in self.stage_times.items()}
+
+    def to_dict(self):
+        """
+        :return: dict, JSON-serialisable profile of the run
+        """
+        return {
+            'frames': self.frames,
+            'per_frame_ms': self.breakdown(),
+            'stage_totals_s': dict(self.stage_times),
+            'workers': {str(worker): {'frames': workerProfile['frames'], 'stage_times': dict(workerProfile['stage_times'])}
+                        for worker, workerProfile in self.workers.items()},
+        }
+
+    def __str__(self):
+        return " | ".join(f"{stage} {ms:.1f} ms" for stage, ms in self.breakdown().items())
+
+
+def run_pipeline(userInput, folderPath, imageFiles, processedImages=None, outputDir=None, multiprocessingToggle=False, numCores=1, chunksPerWorker=CHUNKS_PER_WORKER, profile=None, \
+                 prefetch=None, saver=None, frameStore=None, resultCache=None, failures=None):
+    """
+    Run the retina over imageFiles and yield the number of finished frames as processing advances.
+
+    :param userInput: tuple, retina parameters in the order built by EyeballProject.colletUserInput
+    :param processedImages: array/memmap of shape (N, P, P, 3) receiving the frames, or None
+    :param outputDir: str, write every frame to this directory (under its input name) instead of an array
+    :param multiprocessingToggle: bool, spread the runs over a pool of numCores processes
+    :param chunksPerWorker: int, number of chunks handed to every worker process
+    :param profile: StageProfile, receives the stage timings of every finished frame
+    :param prefetch: int, frames decoded ahead on threads (per process), 0 decodes inline; if None,
+                     PREFETCH_DEPTH in a single process and WORKER_PREFETCH_DEPTH in every pool worker
+    :param saver: FrameSaver, also streams every finished frame of processedImages to disk while the run goes on
+    :param frameStore: FrameStore, of folderPath/imageFiles at this resolution; read instead of decoding the
+                       images when it is complete, filled by this run otherwise
+    :param resultCache: ResultCache, frames found in it are restored instead of processed, the others are added to it
+    :param failures: list, receives the index of every frame that could not be processed; the yielded count includes them
+    """
+    failures = failures if failures is not None else []
+    fovea_type = userInput[8]
+    runs, nextFrames = frame_runs(imageFiles, fovea_type)
+    done = 0
+    restored = 0
+    storeFrames, storeComplete = None, False
+    if frameStore is not None:
+        frameStore.open()
+        storeFrames, storeComplete = frameStore.frames, frameStore.complete
+    try:
+        if resultCache is not None:
+            # Restore the cached frames first, only the others go through the retina
+            resultCache.prepare(userInput, folderPath, imageFiles, nextFrames)
+            missing = set()
+            for n in range(len(imageFiles)):
+                start = time.perf_counter()
+                cached = resultCache.get(n)
+                if cached is None:
+                    missing.add(n)
+                    continue
+                store_frame(n, cached, processedImages, outputDir, imageFiles)
+                if saver is not None and processedImages is not None:
+                    saver.submit(n, processedImages[n])
+                done += 1
+                restored += 1
+                if profile is not None:
+                    profile.add(os.getpid(), {'cache': time.perf_counter() - start}, 1)
+                yield done
+            runs = uncached_runs(runs, missing)
+
+        if multiprocessingToggle and runs:
+            chunks = chunk_runs(runs, numCores * chunksPerWorker)
+            memmapSpec = memmap_spec(processedImages) if outputDir is None else None
+            if memmapSpec is not None:
+                # Make sure the workers map a file that reflects the current contents
+                processedImages.flush()
+            frameStoreSpec = frameStore.spec() if frameStore is not None else None
+            if prefetch is None:
+                prefetch = WORKER_PREFETCH_DEPTH
+            with multiprocessing.Pool(processes=numCores, initializer=init_worker,
+                                      initargs=(userInput, folderPath, imageFiles, nextFrames, memmapSpec, outputDir, prefetch, frameStoreSpec,
+                                                resultCache)) as pool:
+                results = pool.imap_unordered(process_chunk, chunks)
+                pending = {n for run in runs for n in run}
+                while True:
+                    # errors are handled per frame in the workers; a chunk that still fails (e.g. a crashed
+                    # worker) only loses its own frames, the remaining chunks are still collected
+                    try:
+                        chunk_results, worker, stage_times = next(results)
+                    except StopIteration:
+                        break
+                    except Exception as e:
+                        print(f"Error processing chunk: {str(e)}")
+                        continue
+                    for n, status, processed_image in chunk_results:
+                        if processed_image is not None and processedImages is not None:
+                            processedImages[n] = processed_image
+                        if status and saver is not None and processedImages is not None:
+                            saver.submit(n, processedImages[n])
+                        if not status:
+                            failures.append(n)
+                        pending.discard(n)
+                    done += len(chunk_results)
+                    if profile is not None:
+                        profile.add(worker, stage_times, len(chunk_results))
+                    yield done
+                if pending:
+                    # frames of the chunks that failed as a whole
+                    failures.extend(sorted(pending))
+                    done += len(pending)
+                    yield done
+        elif runs:
+            retina = generate_retina_object(*userInput)
+            if prefetch is None:
+                prefetch = PREFETCH_DEPTH
+            for run in runs:
+                for n, processed_image in process_run(retina, folderPath, imageFiles, run, nextFrames, fovea_type, prefetch,
+                                                      storeFrames, storeComplete):
+                    start = time.perf_counter()
+                    _, status, _ = store_frame(n, processed_image, processedImages, outputDir, imageFiles, resultCache)
+                    if status and saver is not None and processedImages is not None:
+                        saver.submit(n, processedImages[n])
+                    if not status:
+                        failures.append(n)
+                    write_time = time.perf_counter() - start
+                    done += 1
+                    if profile is not None:
+                        profile.add(os.getpid(), {**retina.pop_stage_times(), 'write': write_time}, 1)
+                    yield done
+    finally:
+        if frameStore is not None:
+            # A frame that failed (or was restored from the result cache) was not decoded,
+            # so only a run that decoded every frame publishes the store
+            frameStore.finalize(not failures and restored == 0 and done == len(imageFiles))
+        if resultCache is not None:
+            resultCache.prune()
+
+
+def run_video_pipeline(userInput, videoPath, outputPath, queueSize=VIDEO_QUEUE_SIZE, profile=None):
+    """
+    Stream a video through the retina and encode the result into outputPath, yielding the number of
+    finished frames. Decoding and encoding run on their own threads with bounded queues, so memory
+    stays constant whatever the length of the video.
+
+    :param userInput: tuple, retina parameters in the order built by EyeballProject.colletUserInput
+    :param videoPath: str, input video (mp4/avi/...)
+    :param outputPath: str, output video, the codec follows its extension
+    :param queueSize: int, frames buffered ahead of and behind the retina
+    :param profile: StageProfile, receives the stage timings of every finished frame
+    """
+    retina = generate_retina_object(*userInput)
+    resolution = userInput[0]
+    done = 0
+    with VideoReader(videoPath, queueSize=queueSize) as reader, \
+            VideoWriter(outputPath, reader.fps, (resolution, resolution), queueSize=queueSize) as writer:
+        for frames in retina.preprocess_stream(reader):
+            processed_image = retina.apply_preprocessed(*frames)
+            start = time.perf_counter()
+            writer.write(processed_image.astype(np.uint8, copy=False))
+            write_time = time.perf_counter() - start
+            done += 1
+            if profile is not None:
+                profile.add(os.getpid(), {**retina.pop_stage_times(), 'write': write_time}, 1)
+            yield done
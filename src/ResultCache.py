@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import cv2
+import numpy as np
+
+# Persistent cache directory of processed frames when none is configured
+CACHE_DIR_ENV = "EYEBALL_CACHE_DIR"
+
+# Default bound of the cache directory, the least recently used results are evicted beyond it
+RESULT_CACHE_BYTES = 4 * 1024 ** 3
+
+# Bump whenever the retina output changes for the same parameters, so stale results are never reused
+RESULT_CACHE_VERSION = 1
+
+# Lossless and still fast to encode
+CACHE_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# userInput fields that only matter when the switch at the given index is on (or equals the value)
+_DEPENDENT_FIELDS = {
+    6: (5, True),                   # blur kernel
+    9: (8, "dynamic"),              # fovea grid size
+    10: (5, True),                  # gradual blur of the fovea edge
+    12: (11, True),                 # clutter intensity
+    14: (13, True),                 # magnification strength
+    15: (13, True),                 # magnification radius
+    16: (8, "dynamic"),             # flow scale
+    17: (8, "dynamic"),             # flow levels
+    18: (8, "dynamic"),             # flow window size
+}
+
+
+def default_cache_dir():
+    """
+    :return: str, $EYEBALL_CACHE_DIR if set, else ~/.cache/eyeball/results
+    """
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser("~"), ".cache", "eyeball", "results")
+
+
+def _normalize(value):
+    # JSON-stable form of a parameter: tuples become lists, numbers floats, strings lower case
+    if isinstance(value, (tuple, list)):
+        return [_normalize(item) for item in value]
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return str(value).lower()
+
+
+def normalize_user_input(userInput):
+    """
+    Normalize a retina parameter tuple (as built by EyeballProject.colletUserInput) so that equivalent
+    configurations compare equal: 50 and 50.0 are the same radius, and settings of disabled stages
+    (e.g. the clutter intensity with clutter off) are dropped.
+
+    :param userInput: tuple, retina parameters
+    :return: list, normalized parameters
+    """
+    values = [_normalize(value) for value in userInput]
+    for index, (switch, enabled) in _DEPENDENT_FIELDS.items():
+        if index < len(values) and values[switch] != _normalize(enabled):
+            values[index] = None
+    return values
+
+
+def file_fingerprint(path):
+    # Same identity as the thumbnail cache: path + size + mtime, so edited files are recomputed
+    try:
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    except OSError:
+        return None
+
+
+class ResultCache:
+    def __init__(self, cacheDir=None, maxBytes=RESULT_CACHE_BYTES, seed=None):
+        """
+        Content-addressed cache of processed frames. Every frame is keyed on the normalized retina
+        parameters, the RNG seed and the fingerprints of its input file (and, for dynamic foveation, of
+        the frame it is paired with), and stored as a lossless PNG. Reading a result marks it as
+        recently used; prune() evicts the least recently used results beyond maxBytes.
+
+        :param cacheDir: str, cache directory; default_cache_dir() if None
+        :param maxBytes: int, size bound of the cache directory
+        :param seed: int, seed of the retina's random cell activation and clutter; None for the
+                     unseeded global RNG, where any earlier draw is as valid as a new one
+        """
+        self.cacheDir = cacheDir or default_cache_dir()
+        self.maxBytes = maxBytes
+        self.seed = seed
+        self.keys = []
+
+    def prepare(self, userInput, folderPath, imageFiles, nextFrames):
+        """
+        Compute the key of every frame of a run.
+
+        :param userInput: tuple, retina parameters
+        :param folderPath: str, input directory
+        :param imageFiles: list, image file names
+        :param nextFrames: list, index of every frame's successor (or None), see SequenceLoader
+        :return: ResultCache, self
+        """
+        os.makedirs(self.cacheDir, exist_ok=True)
+        config = json.dumps([RESULT_CACHE_VERSION, normalize_user_input(userInput), self.seed])
+        dynamic = userInput[8] == "dynamic"
+        fingerprints = [file_fingerprint(os.path.join(folderPath, fileName)) for fileName in imageFiles]
+        self.keys = []
+        for i, fingerprint in enumerate(fingerprints):
+            if fingerprint is None:
+                # missing input, never cached
+                self.keys.append(None)
+                continue
+            successor = fingerprints[nextFrames[i]] if dynamic and nextFrames[i] is not None else None
+            self.keys.append(hashlib.sha1(f"{config}|{fingerprint}|{successor}".encode()).hexdigest())
+        return self
+
+    def path(self, n):
+        """
+        :param n: int, frame index
+        :return: str, cache file of frame n, None if the frame cannot be cached
+        """
+        key = self.keys[n]
+        return os.path.join(self.cacheDir, key[:2], key + ".png") if key is not None else None
+
+    def get(self, n):
+        """
+        :param n: int, frame index
+        :return: np.array, cached RGB result of frame n, None on a miss
+        """
+        path = self.path(n)
+        if path is None or not os.path.exists(path):
+            return None
+        image = cv2.imread(path)
+        if image is None:
+            return None
+        try:
+            # the mtime is the recency of the entry
+            os.utime(path)
+        except OSError:
+            pass
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    def put(self, n, processed_image):
+        """
+        Store the RGB result of frame n. Written to a temporary name and renamed, so concurrent
+        workers and readers never see a partial file.
+
+        :param n: int, frame index
+        :param processed_image: np.array, uint8 RGB frame
+        """
+        path = self.path(n)
+        if path is None:
+            return
+        ok, data = cv2.imencode(".png", cv2.cvtColor(processed_image.astype(np.uint8, copy=False), cv2.COLOR_RGB2BGR), CACHE_PNG_PARAMS)
+        if not ok:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tempPath = f"{path}.{os.getpid()}.tmp"
+            with open(tempPath, "wb") as file:
+                file.write(data.tobytes())
+            os.replace(tempPath, path)
+        except OSError as e:
+            print(f"Could not cache frame {n}: {str(e)}")
+
+    def prune(self):
+        """Evict the least recently used results until the cache fits in maxBytes."""
+        try:
+            entries = [entry for folder in os.scandir(self.cacheDir) if folder.is_dir()
+                       for entry in os.scandir(folder.path) if entry.is_file()]
+            entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.maxBytes:
+                    break
+                os.remove(path)
+                total -= size
+        except OSError as e:
+            print(f"Could not prune the result cache: {str(e)}")
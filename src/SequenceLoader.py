@@ -0,0 +1,86 @@
+import os
+import re
+
+# Trailing frame number of a file name, e.g. output_10.png -> ("output_", 10)
+FRAME_PATTERN = re.compile(r'^(?P<sequence>.*?)(?P<frame>\d+)$')
+
+
+def natural_key(fileName):
+    """
+    Sort key that orders embedded numbers numerically (output_2 < output_10).
+
+    :param fileName: str, file name to sort
+    :return: list, alternating text and integer parts of the name
+    """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', fileName)]
+
+
+def parse_frame(fileName):
+    """
+    Split a file name into its sequence name and frame number.
+
+    :param fileName: str, file name such as 'output_10.png'
+    :return: tuple, (sequence name, frame number) or (stem, None) if the name has no frame number
+    """
+    stem = os.path.splitext(os.path.basename(fileName))[0]
+    match = FRAME_PATTERN.match(stem)
+    if match is None:
+        return stem, None
+    return match.group('sequence'), int(match.group('frame'))
+
+
+class SequenceLoader:
+    def __init__(self, imageFiles, sort=True):
+        """
+        Index the frame sequences contained in a folder's file list.
+
+        Several sequences may be interleaved in one folder (e.g. cam1_0.png, cam2_0.png, cam1_1.png);
+        frames are grouped by the text before their trailing number and ordered by that number.
+
+        :param imageFiles: list, image file names
+        :param sort: bool, natural-sort the file names; pass False to keep the given order
+                     (and therefore the indices of an existing output array)
+        """
+        self.imageFiles = sorted(imageFiles, key=natural_key) if sort else list(imageFiles)
+        self.sequences = {}
+        self.nextFrames = [None] * len(self.imageFiles)
+        self.runs = []
+        self.build_index()
+
+    def build_index(self):
+        """
+        Group frames per sequence, link every frame to its true successor (frame + 1 of the same
+        sequence) and split each sequence into runs of consecutive frames.
+        """
+        for i, fileName in enumerate(self.imageFiles):
+            sequence, frame = parse_frame(fileName)
+            if frame is None:
+                # Files without a frame number are sequences of their own
+                self.sequences[fileName] = [(0, i)]
+            else:
+                self.sequences.setdefault(sequence, []).append((frame, i))
+
+        for frames in self.sequences.values():
+            frames.sort()
+            run = []
+            for k, (frame, i) in enumerate(frames):
+                if run and frame != frames[k-1][0] + 1:
+                    self.runs.append(run)
+                    run = []
+                elif run:
+                    self.nextFrames[frames[k-1][1]] = i
+                run.append(i)
+            self.runs.append(run)
+
+        # Process runs in file order so the output fills up front to back
+        self.runs.sort(key=lambda run: run[0])
+
+    def next_frame(self, i):
+        """
+        :param i: int, index into imageFiles
+        :return: int, index of the consecutive frame of the same sequence, or None for its last frame
+        """
+        return self.nextFrames[i]
+
+    def __len__(self):
+        return len(self.imageFiles)
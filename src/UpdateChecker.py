@@ -1,6 +1,3 @@
-import requests
-
-
 class UpdateChecker:
     def __init__(self, repo, current_version):
         """
@@ -19,6 +16,8 @@ class UpdateChecker:
 
         :return: dict, latest release information
         """
+        import requests
+
         url = f"https://api.github.com/repos/{self.repo}/releases/latest"
         response = requests.get(url)
         response.raise_for_status()  # Raise an error for bad status codes
@@ -43,6 +42,8 @@ class UpdateChecker:
         """
         if self.latest_release is None:
             self.check_for_update()
+        import requests
+
         url = f'https://github.com/{self.repo}/releases/download/{self.latest_release}/eyeball_project.exe'
         response = requests.get(url, stream=True)
         response.raise_for_status()
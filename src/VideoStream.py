@@ -0,0 +1,143 @@
+import os
+import queue
+import threading
+import cv2
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+# Frames buffered between the reader/writer threads and the retina, bounds the memory of a stream
+VIDEO_QUEUE_SIZE = 16
+
+# Codec used for each output container, anything else falls back to mp4v
+FOURCC = {".avi": "MJPG", ".mp4": "mp4v", ".mov": "mp4v", ".mkv": "mp4v"}
+
+# Marks the end of a frame queue
+_END = None
+
+
+def is_video(path):
+    """
+    :param path: str, file path
+    :return: bool, True if the path is a video container the pipeline can stream
+    """
+    return os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def _put(frames, item, stop):
+    # Blocking put that gives up once the stream is stopped, so a full queue never hangs close()
+    while not stop.is_set():
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class VideoReader:
+    def __init__(self, path, queueSize=VIDEO_QUEUE_SIZE):
+        """
+        Decode a video frame by frame on a background thread. At most queueSize decoded frames
+        are held in memory; iterating yields them in order as BGR arrays.
+
+        :param path: str, video file
+        :param queueSize: int, number of frames decoded ahead of the consumer
+        """
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        # containers without an index report 0 (or garbage), treat that as unknown
+        self.frameCount = max(0, int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.frameSize = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.frames = queue.Queue(maxsize=max(1, queueSize))
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.__read, daemon=True)
+        self.thread.start()
+
+    def __read(self):
+        try:
+            while not self.stop.is_set():
+                ok, frame = self.capture.read()
+                if not ok or not _put(self.frames, frame, self.stop):
+                    break
+        finally:
+            _put(self.frames, _END, self.stop)
+
+    def __iter__(self):
+        while True:
+            frame = self.frames.get()
+            if frame is _END:
+                return
+            yield frame
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.capture.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VideoWriter:
+    def __init__(self, path, fps, frameSize, fourcc=None, queueSize=VIDEO_QUEUE_SIZE):
+        """
+        Encode RGB frames into a video on a background thread (write-behind). write() only blocks
+        when queueSize frames are already waiting to be encoded.
+
+        :param path: str, output video file
+        :param fps: float, frame rate of the output
+        :param frameSize: tuple, (width, height) of the frames
+        :param fourcc: str, four character codec code; chosen from the file extension if None
+        :param queueSize: int, number of frames waiting to be encoded
+        """
+        fourcc = fourcc or FOURCC.get(os.path.splitext(path)[1].lower(), "mp4v")
+        self.path = path
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, frameSize)
+        if not self.writer.isOpened():
+            raise IOError(f"Could not open video writer for {path} ({fourcc})")
+        self.frames = queue.Queue(maxsize=max(1, queueSize))
+        self.stop = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.__write, daemon=True)
+        self.thread.start()
+
+    def __write(self):
+        while True:
+            frame = self.frames.get()
+            if frame is _END:
+                return
+            try:
+                # OpenCV encodes BGR frames
+                self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            except Exception as e:
+                self.error = e
+                self.stop.set()
+                return
+
+    def write(self, frame):
+        """
+        :param frame: np.array, uint8 RGB frame of frameSize
+        """
+        if self.error is not None:
+            raise IOError(f"Could not write to {self.path}: {self.error}")
+        _put(self.frames, frame, self.stop)
+
+    def close(self):
+        # Flush the frames still queued, then finalize the container
+        _put(self.frames, _END, self.stop)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise IOError(f"Could not write to {self.path}: {self.error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,23 +1,222 @@
-from PyQt6.QtWidgets import QVBoxLayout, QWidget, QLabel, QScrollArea, QGridLayout, QHBoxLayout, QPushButton, QSizePolicy, QDialog, QMessageBox
-from PyQt6.QtGui import QPixmap, QImage
-from PyQt6.QtCore import QDir, Qt
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+from PyQt6.QtWidgets import QVBoxLayout, QWidget, QLabel, QListView, QDialog, QSizePolicy
+from PyQt6.QtGui import QPixmap, QImage, QImageReader, QColor
+from PyQt6.QtCore import QDir, Qt, QObject, QRunnable, QThreadPool, QStandardPaths, QAbstractListModel, QModelIndex, QSize, pyqtSignal
 
 import numpy as np
-THUMBNAILS_PER_PAGE = 24
 THUMBNAILS_PER_ROW = 8
+# scaled thumbnails kept in memory, least recently shown are dropped first
+THUMBNAIL_CACHE_SIZE = 400
+# threads generating thumbnails in the background
+THUMBNAIL_THREADS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# thumbnail files kept in the on-disk cache, the oldest are removed beyond this
+THUMBNAIL_DISK_CACHE_FILES = 20000
+
+
+def thumbnail_cache_dir():
+    # Per-user cache directory shared by every run of the app
+    location = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation) or tempfile.gettempdir()
+    path = os.path.join(location, "thumbnails")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def thumbnail_cache_path(cacheDir, path, stat, size):
+    # Cache entries are keyed on path + mtime + file size (and thumbnail size), so edited files get new thumbnails
+    key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size}"
+    return os.path.join(cacheDir, hashlib.sha1(key.encode()).hexdigest() + ".png")
+
+
+class ThumbnailSignals(QObject):
+    # key of the thumbnail, scaled QImage (QPixmaps may only be made in the GUI thread)
+    ready = pyqtSignal(object, object)
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, signals, key, size, path=None, stat=None, image=None, cacheDir=None):
+        """
+        Build one thumbnail off the GUI thread, from an image file (through the on-disk cache) or an array.
+
+        :param signals: ThumbnailSignals, receives the finished thumbnail
+        :param key: hashable, identifies the thumbnail in the preview
+        :param size: int, longest side of the thumbnail
+        :param path: str, image file
+        :param stat: os.stat_result, of path (part of the cache key); read by the task if None
+        :param image: np.array, RGB image to scale instead of a file
+        :param cacheDir: str, on-disk thumbnail cache, None to disable it
+        """
+        super().__init__()
+        self.signals = signals
+        self.key = key
+        self.size = size
+        self.path = path
+        self.stat = stat
+        self.image = image
+        self.cacheDir = cacheDir
+
+    def run(self):
+        if self.image is not None:
+            thumbnail = np2qimage(np.ascontiguousarray(self.image)).scaled(
+                self.size, self.size, aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio)
+        else:
+            thumbnail = self.loadFile()
+        self.signals.ready.emit(self.key, thumbnail)
+
+    def loadFile(self):
+        if self.stat is None:
+            try:
+                self.stat = os.stat(self.path)
+            except OSError:
+                return QImage()
+        cachePath = thumbnail_cache_path(self.cacheDir, self.path, self.stat, self.size) if self.cacheDir else None
+        if cachePath and os.path.exists(cachePath):
+            thumbnail = QImage(cachePath)
+            if not thumbnail.isNull():
+                return thumbnail
+
+        # Decode at (roughly) thumbnail size, JPEG decoders skip most of the full resolution work
+        reader = QImageReader(self.path)
+        reader.setAutoTransform(True)
+        fullSize = reader.size()
+        if fullSize.isValid():
+            reader.setScaledSize(fullSize.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio))
+        thumbnail = reader.read()
+        if not thumbnail.isNull() and cachePath:
+            thumbnail.save(cachePath)
+        return thumbnail
+
+
+class PruneThumbnailCache(QRunnable):
+    def __init__(self, cacheDir, maxFiles=THUMBNAIL_DISK_CACHE_FILES):
+        super().__init__()
+        self.cacheDir = cacheDir
+        self.maxFiles = maxFiles
+
+    def run(self):
+        # Drop the least recently written thumbnails once the cache holds more than maxFiles
+        try:
+            entries = [entry for entry in os.scandir(self.cacheDir) if entry.is_file()]
+            if len(entries) > self.maxFiles:
+                entries.sort(key=lambda entry: entry.stat().st_mtime)
+                for entry in entries[:len(entries) - self.maxFiles]:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"Could not prune the thumbnail cache: {str(e)}")
+
+
+def np2qimage(img: np.array):
+    h, w, c = img.shape
+    # copy, so the QImage does not point into an array that may be freed or rewritten
+    return QImage(img.data, w, h, c*w, QImage.Format.Format_RGB888).copy()
+
+
+class ThumbnailModel(QAbstractListModel):
+    def __init__(self, thumbnailSize, parent=None):
+        """
+        List model over an image folder or an image array. Views only ask for the rows they show, and
+        thumbnails of those rows are built in the background, so the model's memory does not grow with
+        the number of images.
+
+        :param thumbnailSize: int, longest side of the thumbnails
+        """
+        super().__init__(parent)
+        self.thumbnailSize = thumbnailSize
+        self.folderPath = None
+        self.imageFiles = None
+        self.images = None
+        # bumped on every new content, thumbnails of older content are ignored when they arrive
+        self.version = 0
+        self.thumbnailCache = OrderedDict()
+        self.requested = set()
+        self.threadPool = QThreadPool()
+        self.threadPool.setMaxThreadCount(THUMBNAIL_THREADS)
+        self.thumbnailSignals = ThumbnailSignals()
+        self.thumbnailSignals.ready.connect(self.onThumbnailReady)
+        self.placeholder = QPixmap(thumbnailSize, thumbnailSize)
+        self.placeholder.fill(QColor(0, 0, 0, 0))
+        try:
+            self.cacheDir = thumbnail_cache_dir()
+            # on the global pool, cancelPending must not cancel it
+            QThreadPool.globalInstance().start(PruneThumbnailCache(self.cacheDir))
+        except OSError as e:
+            print(f"Thumbnail cache disabled: {str(e)}")
+            self.cacheDir = None
+
+    def setContent(self, folderPath=None, imageFiles=None, images=None):
+        self.beginResetModel()
+        self.cancelPending()
+        self.folderPath, self.imageFiles, self.images = folderPath, imageFiles, images
+        self.version += 1
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.images is not None:
+            return len(self.images)
+        return len(self.imageFiles) if self.imageFiles else 0
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return self.imageFiles[row] if self.images is None else str(row)
+        if role == Qt.ItemDataRole.DecorationRole:
+            key = (self.version, row)
+            if key in self.thumbnailCache:
+                self.thumbnailCache.move_to_end(key)
+                return self.thumbnailCache[key]
+            self.requestThumbnail(key)
+            return self.placeholder
+        return None
+
+    def path(self, row):
+        return QDir(self.folderPath).filePath(self.imageFiles[row])
+
+    def requestThumbnail(self, key):
+        if key in self.requested:
+            return
+        self.requested.add(key)
+        row = key[1]
+        if self.images is not None:
+            task = ThumbnailTask(self.thumbnailSignals, key, self.thumbnailSize, image=self.images[row])
+        else:
+            task = ThumbnailTask(self.thumbnailSignals, key, self.thumbnailSize, path=self.path(row), cacheDir=self.cacheDir)
+        self.threadPool.start(task)
+
+    def onThumbnailReady(self, key, thumbnail):
+        self.requested.discard(key)
+        if key[0] != self.version:
+            return
+        self.thumbnailCache[key] = QPixmap.fromImage(thumbnail)
+        while len(self.thumbnailCache) > THUMBNAIL_CACHE_SIZE:
+            self.thumbnailCache.popitem(last=False)
+        index = self.index(key[1])
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def cancelPending(self):
+        # drop queued thumbnails (e.g. of rows scrolled past); rows still visible ask again when repainted
+        self.threadPool.clear()
+        self.requested.clear()
+
 
 class QImagePreview(QWidget):
+    # row of the thumbnail that became current (clicked or selected with the keyboard)
+    currentRowChanged = pyqtSignal(int)
+
     def __init__(self, parent=None, folderPath: QDir = None, imageFiles: QDir = None, images:list = None):
         super().__init__(parent)
-        self.THUMBNAIL_SIZE = 0
-        self.IMAGE_HEIGHT = 0
-        self.IMAGE_WIDTH = 0
+        self.THUMBNAIL_SIZE = (1280) // THUMBNAILS_PER_ROW
+        self.model = ThumbnailModel(self.THUMBNAIL_SIZE, self)
         self.setupUI()
-        self.currentThumbnailPage = 0
-        self.folderPath = folderPath if folderPath else None
-        self.imageFiles = imageFiles if imageFiles else None
-        self.images = images if images else None
-        self.imageCount = self.getImageCount()
+        if images is not None:
+            self.setImages(images)
+        elif imageFiles:
+            self.setImagePath(folderPath, imageFiles)
 
     def setupUI(self):
         layout = QVBoxLayout(self)
@@ -30,74 +229,47 @@ class QImagePreview(QWidget):
         self.imagePreviewLabel.setScaledContents(True)
         self.imagePreviewLayout.addWidget(self.imagePreviewLabel)
 
-        # Scroll area for thumbnails
-        self.scrollArea = QScrollArea()
-        self.thumbnailGrid = QGridLayout()
-        self.thumbnailWidget = QWidget()
-        self.thumbnailWidget.setLayout(self.thumbnailGrid)
-        self.scrollArea.setWidget(self.thumbnailWidget)
-        self.scrollArea.setWidgetResizable(True)
-        # self.scrollArea.setFixedHeight(300)
-        layout.addWidget(self.scrollArea, stretch=2)
-
-        # Pagination controls
-        paginationLayout = QHBoxLayout()
-        self.prevPageButton = QPushButton("Previous")
-        self.prevPageButton.clicked.connect(self.prevThumbnailPage)
-        self.nextPageButton = QPushButton("Next")
-        self.nextPageButton.clicked.connect(self.nextThumbnailPage)
-        self.pageLabel = QLabel("Page 1", alignment=Qt.AlignmentFlag.AlignCenter)
-
-        paginationLayout.addWidget(self.prevPageButton)
-        paginationLayout.addWidget(self.pageLabel)
-        paginationLayout.addWidget(self.nextPageButton)
-        layout.addLayout(paginationLayout, stretch=1)
-
-        self.THUMBNAIL_SIZE = (1280) // THUMBNAILS_PER_ROW 
-        self.IMAGE_HEIGHT = self.imagePreviewLabel.size().height() // 2
-        self.IMAGE_WIDTH = self.imagePreviewLabel.size().height() // 2
-
-    def getImageCount(self):
-        if self.images is not None:
-            return len(self.images)
-        elif self.imageFiles:
-            return len(self.imageFiles)
-        return 0
-    
-    def updateThumbnails(self):
-        # Clear existing thumbnails
-        self.clearThumbnails()
-        
-        start = self.currentThumbnailPage * THUMBNAILS_PER_PAGE
-        end = min(start + THUMBNAILS_PER_PAGE, self.imageCount)
-        row, col = 0, 0
-        for i in range(start, end):
-            if self.images is not None:
-                image = self.np2qimage(self.images[i])
-
-                pixmap = QPixmap.fromImage(image).scaled(
-                    self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio)
-                
-                thumbnailLabel = QLabel()
-                thumbnailLabel.setPixmap(pixmap)
-                thumbnailLabel.mousePressEvent = lambda x, img=image: self.setInputPreviewImage(image=img)
-                self.thumbnailGrid.addWidget(thumbnailLabel, row, col)
-                
-            else:
-                fileName = self.imageFiles[i]
-                pixmap = QPixmap(QDir(self.folderPath).filePath(fileName)).scaled(
-                    self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, aspectRatioMode=Qt.AspectRatioMode.KeepAspectRatio)
-            
-                thumbnailLabel = QLabel()
-                thumbnailLabel.setPixmap(pixmap)
-                thumbnailLabel.mousePressEvent = lambda x, path=QDir(self.folderPath).filePath(fileName): self.setInputPreviewImage(path=path)
-                self.thumbnailGrid.addWidget(thumbnailLabel, row, col)
-            col += 1
-            if col >= THUMBNAILS_PER_ROW:
-                col = 0
-                row += 1
-
-            self.pageLabel.setText(f"Page {self.currentThumbnailPage+1}")
+        # Virtualized thumbnail grid: only the visible items are painted and loaded
+        self.thumbnailView = QListView()
+        self.thumbnailView.setViewMode(QListView.ViewMode.IconMode)
+        self.thumbnailView.setResizeMode(QListView.ResizeMode.Adjust)
+        self.thumbnailView.setMovement(QListView.Movement.Static)
+        self.thumbnailView.setUniformItemSizes(True)
+        self.thumbnailView.setLayoutMode(QListView.LayoutMode.Batched)
+        self.thumbnailView.setBatchSize(200)
+        self.thumbnailView.setIconSize(QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+        self.thumbnailView.setGridSize(QSize(self.THUMBNAIL_SIZE + 16, self.THUMBNAIL_SIZE + 32))
+        self.thumbnailView.setModel(self.model)
+        self.thumbnailView.clicked.connect(self.onThumbnailClicked)
+        self.thumbnailView.selectionModel().currentChanged.connect(lambda current, previous: self.currentRowChanged.emit(current.row()))
+        self.thumbnailView.verticalScrollBar().valueChanged.connect(self.model.cancelPending)
+        layout.addWidget(self.thumbnailView)
+
+    @property
+    def images(self):
+        return self.model.images
+
+    @images.setter
+    def images(self, images):
+        # releasing the array (e.g. before its memmap is replaced) also empties the view
+        if images is None:
+            self.clearThumbnails()
+        else:
+            self.setImages(images)
+
+    @property
+    def imageCount(self):
+        return self.model.rowCount()
+
+    def currentRow(self):
+        # -1 when no thumbnail is selected
+        return self.thumbnailView.currentIndex().row()
+
+    def onThumbnailClicked(self, index):
+        if self.model.images is not None:
+            self.setInputPreviewImage(image=self.np2qimage(self.model.images[index.row()]))
+        else:
+            self.setInputPreviewImage(path=self.model.path(index.row()))
 
     def setInputPreviewImage(self, path=None, image=None):
         if path:
@@ -107,38 +279,59 @@ class QImagePreview(QWidget):
         self.imagePreviewLabel.setPixmap(pixmap)
         self.dialog.open()
 
-    def prevThumbnailPage(self):
-        if self.currentThumbnailPage > 0:
-            self.currentThumbnailPage -= 1
-            self.updateThumbnails()
-
-    def nextThumbnailPage(self):
-        if (self.currentThumbnailPage + 1) * THUMBNAILS_PER_PAGE < self.imageCount:
-            self.currentThumbnailPage += 1
-            self.updateThumbnails()
-
     def setImages(self, images:np.array):
-        self.images = images
-        self.imageCount = self.getImageCount() 
-        self.updateThumbnails()
+        self.model.setContent(images=images)
+        self.thumbnailView.scrollToTop()
 
     def setImagePath(self, folder:QDir, images:list):
-        self.imageFiles = images
-        self.folderPath = folder
-
-        self.imageCount = self.getImageCount()
-        self.updateThumbnails()
+        self.model.setContent(folderPath=folder, imageFiles=images)
+        self.thumbnailView.scrollToTop()
 
     def np2qimage(self, img:np.array):
-        h,w,c = img.shape
-        qimg = QImage(img.data, w, h, c*w, QImage.Format.Format_RGB888)
-        return qimg
-    
+        return np2qimage(img)
+
     def clearThumbnails(self):
-        while self.thumbnailGrid.count():
-            child = self.thumbnailGrid.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
-    
+        self.model.setContent()
+
     def clearImagePreview(self):
-        self.imagePreviewLabel.clear()
\ No newline at end of file
+        self.imagePreviewLabel.clear()
+
+
+class LivePreview(QWidget):
+    def __init__(self, parent=None):
+        """
+        Shows the latest low resolution render of the selected frame with its status line.
+        """
+        super().__init__(parent)
+        self.pixmap = None
+        layout = QVBoxLayout(self)
+        self.imageLabel = QLabel()
+        self.imageLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.imageLabel.setMinimumSize(256, 256)
+        # the pixmap follows the label's size, not the other way round
+        self.imageLabel.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        layout.addWidget(self.imageLabel, 1)
+        self.statusLabel = QLabel("Select a frame in Input Images, then change the settings to preview them.")
+        self.statusLabel.setWordWrap(True)
+        layout.addWidget(self.statusLabel)
+
+    def setImage(self, image: np.array):
+        self.pixmap = QPixmap.fromImage(np2qimage(np.ascontiguousarray(image)))
+        self.updatePixmap()
+
+    def setStatus(self, text: str):
+        self.statusLabel.setText(text)
+
+    def clear(self):
+        self.pixmap = None
+        self.imageLabel.clear()
+
+    def updatePixmap(self):
+        # upscale the small render to the space available, keeping it square
+        if self.pixmap is not None:
+            self.imageLabel.setPixmap(self.pixmap.scaled(self.imageLabel.size(), Qt.AspectRatioMode.KeepAspectRatio,
+                                                         Qt.TransformationMode.SmoothTransformation))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updatePixmap()
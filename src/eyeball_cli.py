@@ -0,0 +1,177 @@
+import argparse
+import ast
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+
+from ProcessingPipeline import run_pipeline, run_video_pipeline, CHUNKS_PER_WORKER, PREFETCH_DEPTH, WORKER_PREFETCH_DEPTH, StageProfile
+from SequenceLoader import SequenceLoader
+from VideoStream import is_video, VIDEO_QUEUE_SIZE
+from FrameStore import FrameStore, default_store_dir
+from ResultCache import ResultCache, default_cache_dir, RESULT_CACHE_BYTES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_user_input(configPath):
+    """
+    Read a config file written by EyeballProject.save_config and build the retina parameter tuple
+    in the same order as EyeballProject.colletUserInput. Keys missing from older configs fall back
+    to the GUI defaults.
+
+    :param configPath: str, path of the config.json
+    :return: tuple, retina parameters
+    """
+    with open(configPath, 'r') as file:
+        data = json.load(file)
+
+    resolution = int(data['input_resolution'])
+    fovea_center = (int(data['fovea_x']), int(data['fovea_y']))
+    fovea_radius = int(data['fovea_radius'])
+    peripheral_active_cones = data['peripheral_active_cones']
+    fovea_active_rods = data['fovea_active_rods']
+    peripheral_gaussianBlur = data['peripheral_gaussianBlur']
+    peripheral_gaussianBlur_kernal = ast.literal_eval(data['peripheral_gaussianBlur_kernal']) if peripheral_gaussianBlur else None
+    peripheral_grayscale = data['peripheral_grayscale']
+    fovea_type = data.get('fovea_type', "Static").lower()
+    fovea_grid_size = int(data.get('fovea_grid_size') or 0) if fovea_type == "dynamic" else 0
+    fovea_grid_size = (fovea_grid_size, fovea_grid_size)
+    grad_blur = ast.literal_eval(data.get('grad_blur', "(121,121)"))
+    visual_clutter = data.get('visual_clutter', False)
+    clutter_intensity = float(data.get('clutter_intensity', 0.5))
+    cortical_magnification = data.get('cortical_magnification', False)
+    magnifi_strength = float(data.get('magnifi_strength', 1.0))
+    magnifi_radius = float(data.get('magnifi_radius', 0.4))
+    flow_scale = float(data.get('flow_scale', 1.0))
+    flow_levels = int(data.get('flow_levels', 3))
+    flow_winsize = int(data.get('flow_winsize', 15))
+
+    return resolution, fovea_center, fovea_radius, peripheral_active_cones, fovea_active_rods, peripheral_gaussianBlur, peripheral_gaussianBlur_kernal, peripheral_grayscale, \
+        fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius, \
+        flow_scale, flow_levels, flow_winsize
+
+
+def list_images(folderPath):
+    """
+    :param folderPath: str, input directory
+    :return: list, image file names in natural (frame) order
+    """
+    imageFiles = [f for f in os.listdir(folderPath)
+                  if f.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(folderPath, f))]
+    return SequenceLoader(imageFiles).imageFiles
+
+
+def same_path(path, other):
+    """
+    :param path: str, file or directory
+    :param other: str, file or directory
+    :return: bool, True if both resolve to the same location (symlinks and relative paths included)
+    """
+    return os.path.realpath(path) == os.path.realpath(other)
+
+
+def parse_args(argv=None):
+    num_cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Run the artificial retina on a folder of images without the GUI.")
+    parser.add_argument("config", help="config.json written by 'Save Config' in the GUI")
+    parser.add_argument("input_dir", help="folder containing the input images, or a video file (mp4/avi/mov/mkv)")
+    parser.add_argument("output_dir", help="folder the processed images are written to, or the output video file for a video input")
+    parser.add_argument("-w", "--workers", type=int, default=max(1, num_cores - 1),
+                        help=f"number of worker processes, 1 disables multiprocessing (default: {max(1, num_cores - 1)})")
+    parser.add_argument("-c", "--chunks-per-worker", type=int, default=CHUNKS_PER_WORKER,
+                        help=f"number of chunks handed to every worker (default: {CHUNKS_PER_WORKER})")
+    parser.add_argument("-p", "--prefetch", type=int, default=None,
+                        help=f"images decoded ahead on threads by every worker, 0 disables prefetching "
+                             f"(default: {PREFETCH_DEPTH} with one worker, {WORKER_PREFETCH_DEPTH} per worker otherwise)")
+    parser.add_argument("--frame-store", nargs="?", const=default_store_dir(), metavar="DIR",
+                        help="keep the decoded frames of the input folder in a store in DIR (default: "
+                             f"{default_store_dir()}) so later runs on the same folder and resolution skip decoding")
+    parser.add_argument("--result-cache", nargs="?", const=default_cache_dir(), metavar="DIR",
+                        help="reuse processed images cached in DIR by earlier runs with the same parameters and inputs, "
+                             f"and cache the new ones (default: {default_cache_dir()})")
+    parser.add_argument("--result-cache-size", type=int, default=RESULT_CACHE_BYTES // 1024 ** 2, metavar="MB",
+                        help=f"size bound of the result cache, least recently used results are evicted beyond it (default: {RESULT_CACHE_BYTES // 1024 ** 2})")
+    parser.add_argument("--video-queue", type=int, default=VIDEO_QUEUE_SIZE,
+                        help=f"frames buffered while decoding and encoding a video (default: {VIDEO_QUEUE_SIZE})")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print progress")
+    parser.add_argument("--profile", help="write the per-stage timing profile of the run to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Headless batch runner, e.g. python eyeball_cli.py config.json ./frames ./output --workers 32"""
+    args = parse_args(argv)
+    userInput = load_user_input(args.config)
+    if is_video(args.input_dir):
+        return run_video(args, userInput)
+    imageFiles = list_images(args.input_dir)
+    imageFiles_cnt = len(imageFiles)
+    if imageFiles_cnt == 0:
+        print(f"No Images Found in {args.input_dir}")
+        return 1
+    if same_path(args.input_dir, args.output_dir):
+        # outputs keep their input names, they would replace frames that are still to be read
+        print(f"The output directory must differ from the input directory {args.input_dir}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start_time = datetime.datetime.now()
+    profile = StageProfile()
+    frameStore = FrameStore(args.input_dir, imageFiles, userInput[0], args.frame_store) if args.frame_store else None
+    resultCache = ResultCache(args.result_cache, args.result_cache_size * 1024 ** 2) if args.result_cache else None
+    failures = []
+    done = 0
+    for done in run_pipeline(userInput, args.input_dir, imageFiles, outputDir=args.output_dir,
+                             multiprocessingToggle=args.workers > 1, numCores=args.workers,
+                             chunksPerWorker=args.chunks_per_worker, profile=profile, prefetch=args.prefetch,
+                             frameStore=frameStore, resultCache=resultCache, failures=failures):
+        if not args.quiet:
+            elapsed_time = datetime.datetime.now() - start_time
+            estimated_time = elapsed_time / done * (imageFiles_cnt - done)
+            print(f"\r{done}/{imageFiles_cnt} images, Estimated Time Remaining: {estimated_time}", end="", file=sys.stderr)
+
+    end_time = datetime.datetime.now()
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"Processed {done - len(failures)} images into {args.output_dir}. Time taken: {end_time - start_time}")
+    if failures:
+        print(f"Failed to process {len(failures)} images: {', '.join(imageFiles[n] for n in sorted(failures)[:10])}"
+              f"{' ...' if len(failures) > 10 else ''}", file=sys.stderr)
+    print(f"Time per image: {profile}")
+    if args.profile:
+        with open(args.profile, "w") as file:
+            json.dump({'processing_time': str(end_time - start_time), 'stage_profile': profile.to_dict()}, file, indent=4)
+    return 0 if done == imageFiles_cnt and not failures else 1
+
+
+def run_video(args, userInput):
+    """Stream a video through the retina, e.g. python eyeball_cli.py config.json input.mp4 output.mp4"""
+    if same_path(args.input_dir, args.output_dir):
+        print(f"The output video must differ from the input video {args.input_dir}", file=sys.stderr)
+        return 1
+    outputDir = os.path.dirname(os.path.abspath(args.output_dir))
+    os.makedirs(outputDir, exist_ok=True)
+
+    start_time = datetime.datetime.now()
+    profile = StageProfile()
+    done = 0
+    for done in run_video_pipeline(userInput, args.input_dir, args.output_dir, queueSize=args.video_queue, profile=profile):
+        if not args.quiet:
+            print(f"\r{done} frames, Elapsed Time: {datetime.datetime.now() - start_time}", end="", file=sys.stderr)
+
+    end_time = datetime.datetime.now()
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"Processed {done} frames into {args.output_dir}. Time taken: {end_time - start_time}")
+    print(f"Time per frame: {profile}")
+    if args.profile:
+        with open(args.profile, "w") as file:
+            json.dump({'processing_time': str(end_time - start_time), 'stage_profile': profile.to_dict()}, file, indent=4)
+    return 0 if done else 1
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -7,18 +7,21 @@ import multiprocessing
 from PyQt6.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QWidget, QFileDialog, QLabel, QHBoxLayout, \
     QRadioButton, QSlider, QCheckBox, QGroupBox, QComboBox, QTabWidget, QButtonGroup, QLineEdit, QProgressBar, QScrollArea, QToolTip, QMessageBox, QToolBar, QSystemTrayIcon, QStyle
 from PyQt6.QtGui import QIntValidator, QDoubleValidator, QFont, QIcon
-from PyQt6.QtCore import QDir, Qt
-from PIL import Image
-from custom_components import QImagePreview
-import numpy as np
+from PyQt6.QtCore import QDir, Qt, QTimer
+from custom_components import QImagePreview, LivePreview
 from qt_material import apply_stylesheet
-from ImageProcessingWorker import ImageProcessingWorker
+from ImageProcessingWorker import ImageProcessingWorker, VideoProcessingWorker, ImageSavingWorker, PreviewWorker
+from SequenceLoader import SequenceLoader
+from MemmapStore import MemmapStore
 from UpdateChecker import UpdateChecker
 import validations
 
 REPO = "parampatil/eyeball-software"
 CURRENT_VERSION = "v0.1.0"
 
+# Quiet time after the last settings change before the live preview re-renders
+PREVIEW_DEBOUNCE_MS = 150
+
 
 class EyeballProject(QMainWindow):
     """EyeballProject's main window (GUI or view)."""
@@ -30,17 +33,29 @@ class EyeballProject(QMainWindow):
         self.imageCount = None
         self.currentThumbnailPage = 0
         self.processedImages = None
+        # disk-backed output of the current run, its file lives in a per-run scratch file
+        self.memmapStore = MemmapStore()
         self.processTime = None
+        self.stageProfile = None
         self.retina = None
         self.updateChecker = UpdateChecker(REPO, CURRENT_VERSION)
+        self.nextFrames = []
+
+        # Live preview: settings changes restart the timer, the selected frame is rendered once they settle
+        self.previewGeneration = 0
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.previewTimer.timeout.connect(self.renderPreview)
+        self.previewWorker = PreviewWorker()
+        self.previewWorker.result.connect(self.onPreviewRendered)
+        self.previewWorker.error.connect(self.onPreviewFailed)
 
         QToolTip.setFont(QFont('SansSerif', 10))
 
         self.init_UI()
         self.showMaximized()
 
-        # if os.path.exists('temp.mmap'):
-        #     os.remove('temp.mmap')
 
     def init_UI(self):
         """Initialises UI elements."""
@@ -80,6 +95,13 @@ class EyeballProject(QMainWindow):
         self.btnLoad.clicked.connect(self.selectDataset)
         topLayout.addWidget(self.btnLoad, 1)
 
+        # Button to process a video file straight into an output video
+        self.btnVideo = QPushButton('Process Video')
+        self.btnVideo.setToolTip(
+            "Select a video (mp4/avi/mov/mkv) and stream it through the model into an output video.")
+        self.btnVideo.clicked.connect(self.processVideo)
+        topLayout.addWidget(self.btnVideo, 1)
+
         # Label to display number of images
         self.imageCountLabel = QLabel('No images selected')
         topLayout.addWidget(self.imageCountLabel, 2)
@@ -115,6 +137,13 @@ class EyeballProject(QMainWindow):
         self.outputTab = QImagePreview()
         self.tabWidget.addTab(self.outputTab, "Processed Images")
         self.tabWidget.setTabEnabled(1, False)
+
+        # Tab 3: Live Preview of the selected input frame
+        self.previewTab = LivePreview()
+        self.tabWidget.addTab(self.previewTab, "Live Preview")
+        self.tabWidget.setTabEnabled(2, False)
+        self.tabWidget.currentChanged.connect(self.schedulePreview)
+        self.inputTab.currentRowChanged.connect(self.schedulePreview)
         # endregion Tabs
 
         imgViewerGroup.setLayout(imgViewerLayout)
@@ -346,6 +375,38 @@ class EyeballProject(QMainWindow):
         self.sidebarLayout.addWidget(self.dynamicFoveaGridSizeLabel)
         self.sidebarLayout.addWidget(self.dynamicFoveaGridSizeField)
 
+        # Optical flow resolution, computing the flow on a smaller image is much faster
+        self.flowScaleLabel = QLabel("Optical Flow Resolution")
+        self.flowScaleLabel.setToolTip(
+            "Description: Set the resolution at which the optical flow of the Dynamic Fovea is computed, relative to the input resolution.\n"
+            "Lower resolutions are faster but approximate: the chosen grid cell matches the full resolution one in about 44% of frames at 1/2 (60% within one cell) and about 20% at 1/4.\nDefault: 1")
+        self.flowScaleComboBox = QComboBox()
+        self.flowScaleComboBox.addItems(["1", "1/2", "1/4"])
+        self.flowScaleComboBox.setItemData(0, 1.0)
+        self.flowScaleComboBox.setItemData(1, 0.5)
+        self.flowScaleComboBox.setItemData(2, 0.25)
+
+        # Optical flow pyramid levels
+        self.flowLevelsLabel = QLabel("Optical Flow Pyramid Levels")
+        self.flowLevelsLabel.setToolTip(
+            "Description: Set the number of pyramid levels of the optical flow.\nDefault: 3\nMin: 1\nMax: 10")
+        self.flowLevelsField = QLineEdit()
+        self.flowLevelsField.setPlaceholderText("3")
+        self.flowLevelsField.setValidator(QIntValidator(1, 10))
+
+        # Optical flow window size
+        self.flowWinsizeLabel = QLabel("Optical Flow Window Size")
+        self.flowWinsizeLabel.setToolTip(
+            "Description: Set the averaging window size of the optical flow.\nDefault: 15\nMin: 3\nMax: 101")
+        self.flowWinsizeField = QLineEdit()
+        self.flowWinsizeField.setPlaceholderText("15")
+        self.flowWinsizeField.setValidator(QIntValidator(3, 101))
+
+        for widget in (self.flowScaleLabel, self.flowScaleComboBox, self.flowLevelsLabel,
+                       self.flowLevelsField, self.flowWinsizeLabel, self.flowWinsizeField):
+            widget.setEnabled(False)
+            self.sidebarLayout.addWidget(widget)
+
         # TODO: Add grad_blur, visual_clutter, clutter intensity, cortical magnification, magnifi strength, magnifi radius
 
         # Gradual Blur (121, 121) combobox
@@ -462,6 +523,17 @@ class EyeballProject(QMainWindow):
         # self.sidebarLayout.addWidget(self.eyeTypeLabel)
         # self.sidebarLayout.addLayout(eyeTypeLayout)
 
+        # Every other setting of the model also refreshes the live preview (the sliders do it in their slots)
+        for field in (self.inputResolutionField, self.foveaXField, self.foveaYField, self.dynamicFoveaGridSizeField,
+                      self.flowLevelsField, self.flowWinsizeField, self.clutterIntensityField,
+                      self.magnificationStrengthField, self.magnificationRadiusField):
+            field.textChanged.connect(self.schedulePreview)
+        for comboBox in (self.peripheralBlurKernalComboBox, self.flowScaleComboBox, self.gradBlurComboBox):
+            comboBox.currentIndexChanged.connect(self.schedulePreview)
+        for toggle in (self.peripheralBlurToggle, self.peripheralGrayscaleToggle, self.foveaTypeDynamicRadioButton,
+                       self.visualClutterToggle, self.corticalMagnificationToggle):
+            toggle.toggled.connect(self.schedulePreview)
+
         # Adding middle layout to main layout
         layout.addLayout(midLayout)
         # endregion MiddleLayout
@@ -478,9 +550,64 @@ class EyeballProject(QMainWindow):
         self.btnSave.setEnabled(False)
         bottomLayout.addWidget(self.btnSave, 1)
 
+        # Save format and compression
+        saveFormatLayout = QVBoxLayout()
+        self.saveFormatComboBox = QComboBox()
+        self.saveFormatComboBox.setToolTip(
+            "Description: Format of the saved images.\nDefault: Input format")
+        # kept in sync with FrameSaver.SAVE_FORMATS, which is not imported to keep OpenCV out of startup
+        for name, extension in (("Input format", None), ("PNG", ".png"), ("JPEG", ".jpg"), ("WebP (lossless)", ".webp")):
+            self.saveFormatComboBox.addItem(name, extension)
+        saveFormatLayout.addWidget(self.saveFormatComboBox)
+        self.saveLevelField = QLineEdit()
+        self.saveLevelField.setPlaceholderText("Compression")
+        self.saveLevelField.setToolTip(
+            "Description: PNG compression level (0-9, default 3) or JPEG quality (0-100, default 95).\nIgnored for lossless WebP.")
+        self.saveLevelField.setValidator(QIntValidator(0, 100))
+        saveFormatLayout.addWidget(self.saveLevelField)
+        self.saveWhileProcessingToggle = QCheckBox("Save While Processing")
+        self.saveWhileProcessingToggle.setToolTip(
+            "Description: Write every image to the save directory as soon as it is processed.")
+        saveFormatLayout.addWidget(self.saveWhileProcessingToggle)
+        self.directOutputToggle = QCheckBox("Direct to Output Directory")
+        self.directOutputToggle.setToolTip(
+            "Description: Write the images straight to the save directory without keeping them in a temporary file.\nUse for datasets larger than the free disk space. Images keep their input format.")
+        saveFormatLayout.addWidget(self.directOutputToggle)
+        self.npyToggle = QCheckBox("Keep Output as .npy")
+        self.npyToggle.setToolTip(
+            "Description: Store the processed images in a .npy file in the scratch directory,\nwhich other tools can open without copying (np.load(path, mmap_mode='r')).\nThe file is kept when the app closes, its path is shown below the scratch directory.")
+        saveFormatLayout.addWidget(self.npyToggle)
+        self.frameStoreToggle = QCheckBox("Cache Decoded Frames")
+        self.frameStoreToggle.setToolTip(
+            "Description: Keep the decoded input images in a store in the scratch directory,\nso reruns on the same folder and resolution skip decoding. Uses N x P x P x 3 bytes of disk.")
+        saveFormatLayout.addWidget(self.frameStoreToggle)
+        self.resultCacheToggle = QCheckBox("Reuse Cached Results")
+        self.resultCacheToggle.setToolTip(
+            "Description: Keep processed images in a local cache (least recently used evicted beyond 4 GB)\nand skip images already processed with the same settings in an earlier run.")
+        saveFormatLayout.addWidget(self.resultCacheToggle)
+        bottomLayout.addLayout(saveFormatLayout, 1)
+
         # Label to display save directory
+        saveDirLayout = QVBoxLayout()
         self.saveDirLabel = QLabel('No directory selected')
-        bottomLayout.addWidget(self.saveDirLabel, 2)
+        saveDirLayout.addWidget(self.saveDirLabel)
+
+        # Scratch directory of the temporary output file, e.g. a fast NVMe disk or tmpfs
+        self.scratchDir = self.memmapStore.scratchDir
+        self.btnScratchDir = QPushButton('Scratch Directory')
+        self.btnScratchDir.setToolTip(
+            "Select the directory the temporary output file is created in.\nDefault: $EYEBALL_SCRATCH_DIR or the system temp directory")
+        self.btnScratchDir.clicked.connect(self.selectScratchDir)
+        saveDirLayout.addWidget(self.btnScratchDir)
+        self.scratchDirLabel = QLabel(f'Scratch directory: {self.scratchDir}')
+        self.scratchDirLabel.setWordWrap(True)
+        saveDirLayout.addWidget(self.scratchDirLabel)
+        # Path of the kept .npy output of the last run
+        self.npyPathLabel = QLabel('')
+        self.npyPathLabel.setWordWrap(True)
+        self.npyPathLabel.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        saveDirLayout.addWidget(self.npyPathLabel)
+        bottomLayout.addLayout(saveDirLayout, 2)
 
         # Progress Layout
         self.progressLayout = QVBoxLayout()
@@ -500,6 +627,12 @@ class EyeballProject(QMainWindow):
         self.progressLayout.addWidget(self.estimatedTimeLabel)
         # bottomLayout.addWidget(self.estimatedTimeLabel, 1)
 
+        # Live per-stage timing breakdown
+        self.stageTimesLabel = QLabel("")
+        self.stageTimesLabel.setWordWrap(True)
+        self.stageTimesLabel.setToolTip("Average time per image spent in every stage of the retina pipeline.")
+        self.progressLayout.addWidget(self.stageTimesLabel)
+
         self.bottomGroup.setLayout(bottomLayout)
         layout.addWidget(self.bottomGroup)
         # endregion BottomLayout
@@ -510,7 +643,11 @@ class EyeballProject(QMainWindow):
         if folderPath:
             dir = QDir(folderPath)
             dir.setNameFilters(["*.jpg", "*.jpeg", "*.png", "*.bmp"])
-            self.imageFiles = dir.entryList()
+            # natural order keeps frame sequences (output_1, output_2, ..., output_10) in temporal order
+            loader = SequenceLoader(dir.entryList())
+            self.imageFiles = loader.imageFiles
+            # successor of every frame, paired with it by the dynamic fovea in the live preview
+            self.nextFrames = loader.nextFrames
             self.imageCount = len(self.imageFiles)
 
             if self.imageCount == 0:
@@ -530,6 +667,8 @@ class EyeballProject(QMainWindow):
                 folder=folderPath, images=self.imageFiles)
             self.btnRunModel.setEnabled(True)
             self.btnRunModel.setStyleSheet("background-color: green")
+            self.tabWidget.setTabEnabled(2, True)
+            self.previewTab.clear()
             self.tabWidget.setCurrentIndex(0)
             self.progressBar.setMaximum(self.imageCount)
             self.progressBar.setValue(0)
@@ -577,6 +716,9 @@ class EyeballProject(QMainWindow):
         cortical_magnification = self.corticalMagnificationToggle.isChecked()
         magnifi_strength = float(self.magnificationStrengthField.text()) if validations.isFloat(self.magnificationStrengthField.text(), "Magnification Strength") else 1.0
         magnifi_radius = float(self.magnificationRadiusField.text()) if validations.isFloat(self.magnificationRadiusField.text(), "Magnification Radius") else 0.4
+        flow_scale = self.flowScaleComboBox.currentData()
+        flow_levels = int(self.flowLevelsField.text()) if self.flowLevelsField.text() else 3
+        flow_winsize = int(self.flowWinsizeField.text()) if self.flowWinsizeField.text() else 15
 
 
 
@@ -586,11 +728,14 @@ class EyeballProject(QMainWindow):
         # verbose = self.verboseToggle.isChecked() # ! Delete this line
 
         return resolution, fovea_center, fovea_radius, peripheral_active_cones, fovea_active_rods, peripheral_gaussianBlur, peripheral_gaussianBlur_kernal, peripheral_grayscale, \
-            fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius
+            fovea_type, fovea_grid_size, grad_blur, visual_clutter, clutter_intensity, cortical_magnification, magnifi_strength, magnifi_radius, \
+            flow_scale, flow_levels, flow_winsize
 
     def save_log(self, userInput):
         filename = f"Log {datetime.datetime.now().strftime(
             '%Y-%m-%d_%H-%M-%S')}.txt"
+        stageTimes = "\n        ".join(f"{stage}: {ms:.2f}" for stage, ms in (
+            self.stageProfile or {}).get('per_frame_ms', {}).items())
 
         info = f'''
         Image Information:
@@ -622,27 +767,70 @@ class EyeballProject(QMainWindow):
         Multiprocessing: {self.multiprocessingToggle.isChecked()}
         Number of cores: {self.numCoresComboBox.currentData()}
         Processing Time: {self.processTime}
+
+        Stage Timings (ms per image):
+        -----------------------------
+        {stageTimes}
         '''
 
+        # Structured copy of the run for later analysis
+        run = {
+            'user_input': list(userInput),
+            'number_of_images': self.imageCount,
+            'multiprocessing': self.multiprocessingToggle.isChecked(),
+            'number_of_cores': self.numCoresComboBox.currentData(),
+            'processing_time': self.processTime,
+            'stage_profile': self.stageProfile,
+        }
+
         self.processTime = None
+        self.stageProfile = None
 
         with open(filename, "w") as file:
             file.write(info)
+        with open(os.path.splitext(filename)[0] + ".json", "w") as file:
+            json.dump(run, file, indent=4)
 
     def runModel(self):
         self.loadingStateEnable()
         try:
             userInput = [*self.colletUserInput()]
 
-            # Initialize the memmap object to store the processed images
-            if self.processedImages is None or len(self.processedImages) == 0:
-                self.processedImages = self.create_memmap(
-                    # Running the model for the first time
-                    (len(self.imageFiles), userInput[0], userInput[0], 3))
+            # Direct to output directory and Save While Processing both write the images as they finish
+            saveDir = None
+            if self.directOutputToggle.isChecked() or self.saveWhileProcessingToggle.isChecked():
+                saveDir = QFileDialog.getExistingDirectory(
+                    self, 'Select Directory to Save Images')
+                if not saveDir:
+                    self.loadingStateDisable()
+                    self.alert("No directory selected.", "Error")
+                    return
+                if self.isInputFolder(saveDir):
+                    # images keep their input names and would replace frames that are still to be read
+                    self.loadingStateDisable()
+                    self.alert("The save directory must differ from the input folder.", "Error")
+                    return
+                self.saveDirLabel.setText(f'Save directory: {saveDir}')
+
+            outputDir, saver = None, None
+            if self.directOutputToggle.isChecked():
+                # No memmap at all: the workers encode every image straight into saveDir
+                outputDir = saveDir
+                self.destroy_memmap()
+                self.outputTab.clearThumbnails()
+                self.outputTab.clearImagePreview()
             else:
-                # Rerun the model with new parameters
-                self.refresh_memmap(
-                    (len(self.imageFiles), userInput[0], userInput[0], 3))
+                # Initialize the memmap object to store the processed images
+                if self.processedImages is None or len(self.processedImages) == 0:
+                    self.processedImages = self.create_memmap(
+                        # Running the model for the first time
+                        (len(self.imageFiles), userInput[0], userInput[0], 3))
+                else:
+                    # Rerun the model with new parameters
+                    self.refresh_memmap(
+                        (len(self.imageFiles), userInput[0], userInput[0], 3))
+                if saveDir:
+                    saver = self.createFrameSaver(saveDir)
 
             # Report the estimated time
             def estimate_time(est_time):
@@ -651,29 +839,98 @@ class EyeballProject(QMainWindow):
             def setProcessTime(time):
                 self.processTime = time
 
+            def setStageTimes(profile):
+                self.stageProfile = profile
+                self.stageTimesLabel.setText(" | ".join(
+                    f"{stage}: {ms:.1f} ms" for stage, ms in profile['per_frame_ms'].items()))
+
             def processing_finished(processedImages):
                 # Save the log if verbose is enabled
                 if self.verboseToggle.isChecked():
                     self.save_log(userInput)
 
                 self.loadingStateDisable()
-                self.outputTab.setImages(images=processedImages)
+                if outputDir is not None:
+                    # the images only exist on disk, the preview reads (and caches) thumbnails from there
+                    self.outputTab.setImagePath(folder=outputDir, images=self.imageFiles)
+                else:
+                    self.outputTab.setImages(images=processedImages)
+                    self.npyPathLabel.setText(f'Output .npy: {self.memmapStore.path}' if self.memmapStore.keep else '')
+                    self.btnSave.setEnabled(True)
+                    self.btnSave.setStyleSheet("background-color: green")
                 self.tabWidget.setTabEnabled(1, True)
                 self.tabWidget.setCurrentIndex(1)
-                self.btnSave.setEnabled(True)
                 self.alert("Model run successfully.", "Information")
-                self.btnSave.setStyleSheet("background-color: green")
                 del processedImages
                 print("Processing finished")
                 del self.worker
 
+            frameStoreDir = os.path.join(self.scratchDir, "eyeball_frames") if self.frameStoreToggle.isChecked() else None
+
             # Create a worker thread to process the images
             self.worker = ImageProcessingWorker(userInput, self.folderPath, self.imageFiles, self.multiprocessingToggle.isChecked(
-            ), self.numCoresComboBox.currentData(), self.processedImages)
+            ), self.numCoresComboBox.currentData(), self.processedImages, saver, outputDir, frameStoreDir,
+                self.resultCacheToggle.isChecked())
             self.worker.progress.connect(self.progressBar.setValue)
             self.worker.result.connect(processing_finished)
             self.worker.estimated_time.connect(estimate_time)
             self.worker.processTime.connect(setProcessTime)
+            self.worker.stageTimes.connect(setStageTimes)
+            self.worker.start()
+
+        except validations.ValidationException as e:
+            self.loadingStateDisable()
+            self.alert(f"Validation Failed: {str(e)}", "Error")
+            print(f"Validation Failed: {str(e)}")
+        except Exception as e:
+            self.loadingStateDisable()
+            self.alert(f"An error occurred: {str(e)}", "Error")
+            print(f"An error occurred: {str(e)}")
+
+    def processVideo(self):
+        videoPath = QFileDialog.getOpenFileName(
+            self, 'Select Video', '', 'Videos (*.mp4 *.avi *.mov *.mkv)')[0]
+        if not videoPath:
+            return
+        outputPath = QFileDialog.getSaveFileName(
+            self, 'Save Processed Video', os.path.splitext(videoPath)[0] + "_retina.mp4", 'Videos (*.mp4 *.avi)')[0]
+        if not outputPath:
+            return
+
+        self.loadingStateEnable()
+        try:
+            userInput = [*self.colletUserInput()]
+            # Imported here so the GUI starts without loading OpenCV
+            from VideoStream import VideoReader
+            with VideoReader(videoPath, queueSize=1) as reader:
+                frameCount = reader.frameCount
+
+            self.imageCountLabel.setText(f'Video: {videoPath}, Frames: {frameCount or "unknown"}')
+            # a busy indicator when the container does not report its length
+            self.progressBar.setMaximum(frameCount)
+            self.progressBar.setValue(0)
+
+            def setStageTimes(profile):
+                self.stageProfile = profile
+                self.stageTimesLabel.setText(" | ".join(
+                    f"{stage}: {ms:.1f} ms" for stage, ms in profile['per_frame_ms'].items()))
+
+            def processing_finished(outputPath):
+                self.loadingStateDisable()
+                self.alert(f"Video saved at {outputPath}", "Information")
+                del self.worker
+
+            def processing_failed(message):
+                self.loadingStateDisable()
+                self.alert(f"An error occurred: {message}", "Error")
+                del self.worker
+
+            self.worker = VideoProcessingWorker(userInput, videoPath, outputPath, frameCount)
+            self.worker.progress.connect(self.progressBar.setValue)
+            self.worker.result.connect(processing_finished)
+            self.worker.error.connect(processing_failed)
+            self.worker.estimated_time.connect(self.estimatedTimeLabel.setText)
+            self.worker.stageTimes.connect(setStageTimes)
             self.worker.start()
 
         except validations.ValidationException as e:
@@ -688,35 +945,70 @@ class EyeballProject(QMainWindow):
     def saveImages(self):
         saveDir = QFileDialog.getExistingDirectory(
             self, 'Select Directory to Save Images')
+        if saveDir and self.isInputFolder(saveDir):
+            self.alert("The save directory must differ from the input folder.", "Error")
+            return
         if saveDir:
             self.saveDirLabel.setText(f'Save directory: {saveDir}')
-            for i, image in enumerate(self.processedImages):
-                Image.fromarray(image).save(
-                    QDir(saveDir).filePath(self.imageFiles[i]))
-            self.alert(f"Saved {len(self.processedImages)} images to {
-                       saveDir}", "Information")
-            print(f'Saved {len(self.processedImages)} images to {saveDir}')
-
-    def create_memmap(self, size, path='temp.mmap', dtype='uint8', mode='w+'):
+            self.btnSave.setEnabled(False)
+            self.progressBar.setMaximum(len(self.processedImages))
+            self.progressBar.setValue(0)
+            self.progressBar.setVisible(True)
+            self.estimatedTimeLabel.setText("Saving images...")
+
+            def saving_finished(errors):
+                self.btnSave.setEnabled(True)
+                self.estimatedTimeLabel.setText("")
+                saved = len(self.processedImages) - len(errors)
+                if errors:
+                    self.alert(f"Saved {saved} images to {saveDir}, {len(errors)} failed:\n" + "\n".join(errors[:10]), "Error")
+                else:
+                    self.alert(f"Saved {saved} images to {saveDir}", "Information")
+                print(f'Saved {saved} images to {saveDir}')
+                del self.saveWorker
+
+            # Images are encoded on a thread pool, the GUI only receives progress
+            self.saveWorker = ImageSavingWorker(self.createFrameSaver(saveDir), self.processedImages)
+            self.saveWorker.progress.connect(self.progressBar.setValue)
+            self.saveWorker.result.connect(saving_finished)
+            self.saveWorker.start()
+
+    def isInputFolder(self, directory):
+        return bool(self.folderPath) and os.path.realpath(directory) == os.path.realpath(self.folderPath)
+
+    def createFrameSaver(self, saveDir):
+        # Imported here so the GUI starts without loading OpenCV
+        from FrameSaver import FrameSaver
+        level = int(self.saveLevelField.text()) if self.saveLevelField.text() else None
+        return FrameSaver(saveDir, self.imageFiles, extension=self.saveFormatComboBox.currentData(), level=level)
+
+    def create_memmap(self, size, dtype='uint8'):
         """Creates a np memmap object to store and access large np arrays dynamically from disk. 
-        Use this to hold the processed output images."""
-        return np.memmap(filename=path, dtype=dtype, mode=mode, shape=size)
+        Use this to hold the processed output images. The file is created in the scratch directory."""
+        self.memmapStore.scratchDir = self.scratchDir
+        self.memmapStore.npy = self.npyToggle.isChecked()
+        return self.memmapStore.open(size, dtype=dtype)
 
     def refresh_memmap(self, shape):
         self.outputTab.clearThumbnails()
         self.outputTab.clearImagePreview()
         self.outputTab.images = None
-        # premature optimization
-        if self.imageCount != len(self.processedImages) or shape[1] != self.processedImages.shape[1]:
-            self.destroy_memmap()
-            self.processedImages = self.create_memmap(shape)
+        # the store keeps the file when the shape (and location/format) did not change
+        self.processedImages = None
+        self.processedImages = self.create_memmap(shape)
         return
 
     def destroy_memmap(self):
         self.processedImages = None
         self.outputTab.images = None
-        if os.path.exists('temp.mmap'):
-            os.remove('temp.mmap')
+        self.memmapStore.release()
+
+    def selectScratchDir(self):
+        scratchDir = QFileDialog.getExistingDirectory(
+            self, 'Select Scratch Directory for Temporary Output', self.scratchDir)
+        if scratchDir:
+            self.scratchDir = scratchDir
+            self.scratchDirLabel.setText(f'Scratch directory: {scratchDir}')
 
     def load_config(self):
         print("Loading config data...")
@@ -761,6 +1053,11 @@ class EyeballProject(QMainWindow):
                     self.corticalMagnificationToggle.setChecked(data['cortical_magnification'])
                     self.magnificationStrengthField.setText(str(data['magnifi_strength']))
                     self.magnificationRadiusField.setText(str(data['magnifi_radius']))
+                    # optical flow settings are missing from older configs
+                    self.flowScaleComboBox.setCurrentIndex(
+                        max(0, self.flowScaleComboBox.findData(float(data.get('flow_scale', 1.0)))))
+                    self.flowLevelsField.setText(str(data.get('flow_levels', 3)))
+                    self.flowWinsizeField.setText(str(data.get('flow_winsize', 15)))
 
                     print("Config Data loaded.")
             except Exception as e:
@@ -796,6 +1093,9 @@ class EyeballProject(QMainWindow):
                     'cortical_magnification': self.corticalMagnificationToggle.isChecked(),
                     'magnifi_strength': float(self.magnificationStrengthField.text()),
                     'magnifi_radius': float(self.magnificationRadiusField.text()),
+                    'flow_scale': self.flowScaleComboBox.currentData(),
+                    'flow_levels': int(self.flowLevelsField.text() or 3),
+                    'flow_winsize': int(self.flowWinsizeField.text() or 15),
                     
 
                 }
@@ -825,14 +1125,17 @@ class EyeballProject(QMainWindow):
     # Define the slot to update the slider value label
     def onFoveaRadiusChanged(self, value):
         self.foveaRadiusValueLabel.setText(str(value))
+        self.schedulePreview()
 
     # Define the slot to update the Peripheral Active Cone Cells value label
     def onPeripheralConeCellsChanged(self, value):
         self.peripheralConeCellsValueLabel.setText(f"{value}%")
+        self.schedulePreview()
 
     # Define the slot to update the Fovea Active Rod Cells value label
     def onFoveaRodCellsChanged(self, value):
         self.foveaRodCellsValueLabel.setText(f"{value}%")
+        self.schedulePreview()
 
     # Slot to handle the state change of the Peripheral Gaussian Blur toggle
     def onPeripheralBlurToggled(self, state):
@@ -852,6 +1155,9 @@ class EyeballProject(QMainWindow):
     def onFoveaTypeSelected(self, selected):
         self.dynamicFoveaGridSizeLabel.setEnabled(selected)
         self.dynamicFoveaGridSizeField.setEnabled(selected)
+        for widget in (self.flowScaleLabel, self.flowScaleComboBox, self.flowLevelsLabel,
+                       self.flowLevelsField, self.flowWinsizeLabel, self.flowWinsizeField):
+            widget.setEnabled(selected)
 
     # Slot to handle the selection of clutter
     def onVisualClutterToggled(self, selected):
@@ -865,8 +1171,42 @@ class EyeballProject(QMainWindow):
         self.magnificationRadiusLabel.setEnabled(selected)
         self.magnificationRadiusField.setEnabled(selected)
 
+    # Restart the debounce timer, only a visible preview is rendered
+    def schedulePreview(self, *args):
+        if self.folderPath and self.tabWidget.currentWidget() is self.previewTab:
+            self.previewTimer.start()
+
+    def renderPreview(self):
+        try:
+            userInput = self.colletUserInput()
+        except validations.ValidationException as e:
+            self.previewTab.setStatus(f"Invalid settings: {str(e)}")
+            return
+        row = max(0, self.inputTab.currentRow())
+        nextRow = self.nextFrames[row] if row < len(self.nextFrames) else None
+        imagePath = os.path.join(self.folderPath, self.imageFiles[row])
+        nextImagePath = os.path.join(self.folderPath, self.imageFiles[nextRow]) if nextRow is not None else None
+        # renders of older generations are ignored when they arrive
+        self.previewGeneration += 1
+        self.previewTab.setStatus(f"Rendering {self.imageFiles[row]}...")
+        self.previewWorker.render(self.previewGeneration, userInput, imagePath, nextImagePath)
+
+    def onPreviewRendered(self, generation, image, seconds):
+        if generation != self.previewGeneration:
+            return
+        self.previewTab.setImage(image)
+        self.previewTab.setStatus(f"{image.shape[1]}x{image.shape[0]} preview rendered in {seconds * 1000:.0f} ms")
+
+    def onPreviewFailed(self, generation, message):
+        if generation == self.previewGeneration:
+            self.previewTab.setStatus(f"Preview failed: {message}")
+
     # Loading State - Disable all buttons
     def loadingStateEnable(self):
+        # one run at a time: a second worker would replace self.worker while the first is still running
+        self.btnLoad.setEnabled(False)
+        self.btnVideo.setEnabled(False)
+        self.btnRunModel.setEnabled(False)
         self.btnSave.setEnabled(False)
         self.progressBar.reset()
         self.progressBar.setVisible(True)
@@ -874,6 +1214,10 @@ class EyeballProject(QMainWindow):
 
     # Loading State - Enable all buttons
     def loadingStateDisable(self):
+        self.btnLoad.setEnabled(True)
+        self.btnVideo.setEnabled(True)
+        # the model can only run on a loaded dataset
+        self.btnRunModel.setEnabled(bool(self.imageCount))
         self.sidebarLayoutWidget.setEnabled(True)
 
     # Aletr Message Box
@@ -934,15 +1278,14 @@ class EyeballProject(QMainWindow):
                 self.alert(f"An error occurred while downloading the update: {str(e)}", "Error")
 
     # Clean up the temp file before closing the window
-    # def closeEvent(self, event):
-    #     try:
-    #         self.destroy_memmap()
-
-    #         if os.path.exists('temp.mmap'):
-    #             os.remove('temp.mmap')
-    #     except Exception as e:
-    #         print(f"An error occurred: {str(e)}")
-    #         self.alert(f"An error occurred: {str(e)}", "Error")
+    def closeEvent(self, event):
+        try:
+            self.previewTimer.stop()
+            self.previewWorker.stop()
+            self.destroy_memmap()
+        except Exception as e:
+            print(f"An error occurred: {str(e)}")
+        super().closeEvent(event)
 
 
 def main():
@@ -0,0 +1,37 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ArtificialRetinaNew import ArtificialRetina
+
+P = 224
+
+
+def _frames(x, y, sigma, shift):
+    # a smooth blob centred at (x, y) moving right by shift pixels on a black background
+    yy, xx = np.mgrid[:P, :P]
+    blob = lambda cx: (255 * np.exp(-((xx - cx) ** 2 + (yy - y) ** 2) / (2 * sigma ** 2))).astype(np.uint8)
+    return blob(x), blob(x + shift)
+
+
+@pytest.mark.parametrize("grid", [10, 30, 40])
+@pytest.mark.parametrize("flow_scale", [1.0, 0.5, 0.25])
+@pytest.mark.parametrize("x, y", [(150, 140), (60, 170)])
+def test_dynamic_fovea_follows_motion(x, y, flow_scale, grid):
+    prev_gray, current_gray = _frames(x, y, sigma=24, shift=8)
+    retina = ArtificialRetina(P=P, foveation_type='dynamic', flow_scale=flow_scale)
+    fovea_x, fovea_y = retina.dynamic_fovea(grid_size=(grid, grid), prev_gray=prev_gray, current_gray=current_gray)
+    assert abs(fovea_x - x) <= 16 and abs(fovea_y - y) <= 16
+
+
+@pytest.mark.parametrize("grid", [30, 40])
+def test_dynamic_fovea_fine_grid_small_scale(grid):
+    # at 1/8 of 224 the flow image is narrower than the grid; empty cells must not pin the fovea
+    # to the top left cell
+    prev_gray, current_gray = _frames(150, 150, sigma=40, shift=16)
+    retina = ArtificialRetina(P=P, foveation_type='dynamic', flow_scale=0.125)
+    fovea_x, fovea_y = retina.dynamic_fovea(grid_size=(grid, grid), prev_gray=prev_gray, current_gray=current_gray)
+    assert fovea_x >= P // 2 and fovea_y >= P // 2